@@ -5,6 +5,8 @@ from src.spending_plan import conscious_spending_plan
 from src.average_spending import average_spending
 from src.raw_data_viewer import raw_data_viewer
 from src.manage_money_owed import manage_money_owed
+from src.export_data import export_data_page
+from src.result_cache import cached_dataframe, format_cache_stats
 from src.constants import *
 from src.backend import (
     load_config_file,
@@ -14,6 +16,8 @@ from src.backend import (
 from src.database import (
     bootstrap_database,
     get_dataframe_from_database,
+    get_ledgers,
+    ledger_label,
     refresh_database
 )
 
@@ -34,26 +38,37 @@ view = st.sidebar.radio("Go to", [
     "🛠 Config Editor",
     "📋 Raw Data",
     "📤 Upload Expense Data (.csv)",
+    "📦 Export Data",
     "💸 Manage Money Owed"
 ])
 
+# Ledger (per-year database) selection; nothing selected means all ledgers
+available_ledgers = get_ledgers()
+selected_ledgers = st.sidebar.multiselect(
+    "Ledgers", available_ledgers, default=available_ledgers, format_func=ledger_label
+)
+selected_ledgers = selected_ledgers or None
+st.session_state.selected_ledgers = selected_ledgers
+
 # ---- View: Upload CSV Files ----
 if view == "📤 Upload Expense Data (.csv)":
     manage_csvs_page(category_config)
     
 # ---- View: Spending Plan ----
 elif view == "💰 Conscious Spending":
-    df = get_dataframe_from_database()
-    conscious_spending_plan(df, category_config)
+    conscious_spending_plan(
+        lambda: cached_dataframe(selected_ledgers), category_config, ledgers=selected_ledgers
+    )
 
 # ---- View: Spending Plan ----
 elif view == "📊 Average Spending":
-    df = get_dataframe_from_database()
-    average_spending(df, category_config)
+    average_spending(
+        lambda: cached_dataframe(selected_ledgers), category_config, ledgers=selected_ledgers
+    )
 
 # ---- View: Repeated Charges ----
 elif view == "🔁 Repeated Charges":
-    df = get_dataframe_from_database()
+    df = get_dataframe_from_database(selected_ledgers)
     st.title("🔁 Repeated Charges")
     st.dataframe(show_repeated_charges(df))
 
@@ -68,11 +83,15 @@ elif view == "🛠 Config Editor":
 
 # ---- View: Raw Data ----
 elif view == "📋 Raw Data":
-    df = get_dataframe_from_database()
+    df = get_dataframe_from_database(selected_ledgers)
     raw_data_viewer(df, category_config)
 
-#---- View: Manage Money Owed ----
-# Make this better later, it needs some love
-# elif view == "💸 Manage Money Owed":
-#     manage_money_owed(category_config)
-   
\ No newline at end of file
+# ---- View: Export Data ----
+elif view == "📦 Export Data":
+    export_data_page(category_config)
+
+# ---- View: Manage Money Owed ----
+elif view == "💸 Manage Money Owed":
+    manage_money_owed(category_config, ledgers=selected_ledgers)
+
+st.sidebar.caption(format_cache_stats())
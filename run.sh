@@ -2,6 +2,7 @@
 
 # Define paths
 DATA_DIR="data"
+LEDGERS_DIR="ledgers"
 CONFIG_FILE="configs/config.yaml"
 CONTACTS_FILE="configs/contacts.yaml"
 
@@ -11,6 +12,12 @@ if [ ! -d "$DATA_DIR" ]; then
   mkdir -p "$DATA_DIR"
 fi
 
+# Create ledgers directory (one database per year) if it doesn't exist
+if [ ! -d "$LEDGERS_DIR" ]; then
+  echo "Creating $LEDGERS_DIR directory..."
+  mkdir -p "$LEDGERS_DIR"
+fi
+
 # Create config.yaml with default contents if it doesn't exist
 if [ ! -f "$CONFIG_FILE" ]; then
   echo "Creating default config.yaml..."
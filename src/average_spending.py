@@ -3,29 +3,16 @@ import pandas as pd
 from dateutil.relativedelta import relativedelta
 
 from src.backend import parse_date_input
+from src.result_cache import view_cache, cache_key, config_hash
 from src.constants import *
 
-def average_spending(df, category_config):
-    st.title("📊 Average Spending")
-
-    user_input = st.text_input(
-        "Enter month, year or date range (e.g. 'Jan 2024', '2024', 'Jan 2024 to Mar 2024')"
-    )
-    interval = st.radio("Averaging Interval", ["Yearly", "Monthly", "Weekly", "Daily", "All Time (divisor = 1)"])
-
-    try:
-        start_date, end_date, is_year_only = parse_date_input(user_input)
-    except Exception as e:
-        st.warning(str(e))
-        return
-
+def compute_average_spending(df, category_config, start_date, end_date, is_year_only, interval):
     df[DATE_STR] = pd.to_datetime(df[DATE_STR])
 
     if is_year_only:
         year_df = df[df[DATE_STR].dt.year == start_date.year].copy()
         if year_df.empty:
-            st.warning("No transactions found for the selected year.")
-            return
+            return {"warning": "No transactions found for the selected year."}
         filtered = year_df
         actual_end_date = year_df[DATE_STR].max()
         start_date = pd.Timestamp(f"{start_date.year}-01-01")
@@ -33,13 +20,11 @@ def average_spending(df, category_config):
     elif end_date:
         filtered = df[(df[DATE_STR] >= start_date) & (df[DATE_STR] <= end_date)].copy()
         if filtered.empty:
-            st.warning("No transactions found in the selected range.")
-            return
+            return {"warning": "No transactions found in the selected range."}
     else:
         month_df = df[(df[DATE_STR].dt.month == start_date.month) & (df[DATE_STR].dt.year == start_date.year)].copy()
         if month_df.empty:
-            st.warning("No transactions found for the selected month.")
-            return
+            return {"warning": "No transactions found for the selected month."}
         filtered = month_df
         actual_end_date = month_df[DATE_STR].max()
         start_date = pd.Timestamp(f"{start_date.year}-{start_date.month:02d}-01")
@@ -60,8 +45,6 @@ def average_spending(df, category_config):
     else:  # All Time
         divisor = 1
 
-    st.markdown(f"### From {start_date.date()} to {end_date.date()} ({'total' if interval == 'All Time' else f'{divisor} {interval.lower()}s'})")
-
     filtered[EXPENSE_STR] = pd.to_numeric(filtered[EXPENSE_STR].fillna(0), errors="coerce")
     filtered[INCOME_STR] = pd.to_numeric(filtered[INCOME_STR].fillna(0), errors="coerce")
 
@@ -86,13 +69,6 @@ def average_spending(df, category_config):
     fixed_categories_normalized = {cat.lower().strip() for cat in fixed_expense_categories}
     avg_fixed_spending = normalized_expenses[normalized_expenses.index.isin(fixed_categories_normalized)].sum()
 
-    st.subheader(f"📉 {'Total' if interval == 'All Time' else 'Average'} Expenses per Category")
-    if not expenses.empty:
-        for cat, val in expenses.items():
-            st.markdown(f"**{cat}**: ${val:.2f}")
-    else:
-        st.info("No categorized expense transactions found.")
-
     # --- INCOME ---
     valid_income_categories = set(["income", "uncategorized"])
 
@@ -105,6 +81,58 @@ def average_spending(df, category_config):
         .sort_values(ascending=False)
     )
 
+    payroll_income = income_data[income_data[PLACE_STR].str.lower().str.contains("payroll", na=False)]
+    avg_payroll_monthly = payroll_income[INCOME_STR].sum() / divisor
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "divisor": divisor,
+        "expenses": expenses,
+        "income_by_category": income_by_category,
+        "avg_fixed_spending": avg_fixed_spending,
+        "avg_payroll_monthly": avg_payroll_monthly,
+    }
+
+def average_spending(load_df, category_config, ledgers=None):
+    st.title("📊 Average Spending")
+
+    user_input = st.text_input(
+        "Enter month, year or date range (e.g. 'Jan 2024', '2024', 'Jan 2024 to Mar 2024')"
+    )
+    interval = st.radio("Averaging Interval", ["Yearly", "Monthly", "Weekly", "Daily", "All Time (divisor = 1)"])
+
+    try:
+        start_date, end_date, is_year_only = parse_date_input(user_input)
+    except Exception as e:
+        st.warning(str(e))
+        return
+
+    key = cache_key(
+        "average_spending", start_date, end_date, is_year_only, interval, config_hash(category_config),
+        ledgers=ledgers
+    )
+    result = view_cache.get_or_compute(
+        key,
+        lambda: compute_average_spending(load_df(), category_config, start_date, end_date, is_year_only, interval)
+    )
+    if "warning" in result:
+        st.warning(result["warning"])
+        return
+
+    start_date, end_date, divisor = result["start_date"], result["end_date"], result["divisor"]
+    expenses, income_by_category = result["expenses"], result["income_by_category"]
+    avg_fixed_spending, avg_payroll_monthly = result["avg_fixed_spending"], result["avg_payroll_monthly"]
+
+    st.markdown(f"### From {start_date.date()} to {end_date.date()} ({'total' if interval == 'All Time' else f'{divisor} {interval.lower()}s'})")
+
+    st.subheader(f"📉 {'Total' if interval == 'All Time' else 'Average'} Expenses per Category")
+    if not expenses.empty:
+        for cat, val in expenses.items():
+            st.markdown(f"**{cat}**: ${val:.2f}")
+    else:
+        st.info("No categorized expense transactions found.")
+
     st.subheader(f"💰 {'Total' if interval == 'All Time' else 'Average'} Income per Category")
     if not income_by_category.empty:
         for cat, val in income_by_category.items():
@@ -114,9 +142,6 @@ def average_spending(df, category_config):
 
     # --- TIP SECTION (Only for Monthly) ---
     if interval == "Monthly":
-        payroll_income = income_data[income_data[PLACE_STR].str.lower().str.contains("payroll", na=False)]
-        avg_payroll_monthly = payroll_income[INCOME_STR].sum() / divisor
-
         st.markdown(
             f"""
             <div style="background-color: #fff9db; padding: 1rem; border-radius: 0.5rem; border: 1px solid #f1e4b3;">
@@ -33,8 +33,11 @@ def show_repeated_charges(df):
     df.columns = df.columns.str.strip().str.lower()
     exclude_keywords = ["Branch Transaction", "Internet Banking", "Electronic Funds Transfer", "WITHDRAWAL"]
     df_filtered = df[~df[PLACE_STR].str.contains('|'.join(exclude_keywords), case=False, na=False)]
-    recurring = df_filtered.groupby([PLACE_STR, EXPENSE_STR]).filter(lambda x: len(x) > 1)
-    return recurring.sort_values(by=[PLACE_STR, EXPENSE_STR])
+    # Group on the interned merchant so store numbers and locations don't split a subscription
+    merchant_key = MERCHANT_ID_STR if MERCHANT_ID_STR in df_filtered.columns else PLACE_STR
+    counts = df_filtered.groupby([merchant_key, EXPENSE_STR])[EXPENSE_STR].transform("size")
+    recurring = df_filtered[counts > 1]
+    return recurring.sort_values(by=[merchant_key, EXPENSE_STR])
 
 
 def load_config_file(config_path=None):
@@ -63,6 +66,14 @@ def update_categories_config(config_path):
             config["spending_categories"][cat]["keywords"] = [k.strip().lower() for k in keywords.split(",") if k.strip()]
             config["spending_categories"][cat]["target_range"] = [lower, upper]
 
+    with st.expander("🔎 Test a keyword"):
+        test_keyword = st.text_input("Keyword to look up in transaction descriptions")
+        if test_keyword.strip():
+            phrase = test_keyword.strip().replace('"', '')
+            matches = search_transactions(f'"{phrase}"')
+            st.caption(f"{len(matches)} transactions match '{phrase}'")
+            st.dataframe(matches[[DATE_STR, PLACE_STR, EXPENSE_STR, INCOME_STR, CATEGORY_STR]].head(200), use_container_width=True)
+
     if st.button("Save Config"):
         with open(config_path, "w") as f:
             yaml.dump(config, f)
@@ -114,15 +125,33 @@ def update_contacts_config(contacts, new_contact_name, new_contact_text):
         with open(CONTACTS_PATH, "w") as f:
             yaml.dump({"contacts": contacts}, f, default_flow_style=False)
 
-def load_and_filter_data(category_filter=None, date_range=None):
-    df = get_dataframe_from_database()
+        tag_transaction_contacts(contacts)
+
+def assign_trip_to_contact(contacts, contact_name, trip_category):
+    contact = get_contact_by_name(contact_name, contacts)
+    if contact is None:
+        return False
+
+    trips = contact.setdefault("trips", [])
+    if trip_category not in trips:
+        trips.append(trip_category)
+
+        with open(CONTACTS_PATH, "w") as f:
+            yaml.dump({"contacts": contacts}, f, default_flow_style=False)
+
+    rebuild_contact_ledger(contacts)
+    return True
+
+def load_and_filter_data(category_filter=None, date_range=None, ledgers=None):
+    df = get_dataframe_from_database(ledgers)
 
     if category_filter:
         df = df[df[CATEGORY_STR] == category_filter]
 
     if date_range:
         start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-        df = df[(df[DATE_STR] >= start_date) & (df[DATE_STR] <= end_date)]
+        dates = pd.to_datetime(df[DATE_STR], errors="coerce")
+        df = df[(dates >= start_date) & (dates <= end_date)]
 
     return df
 
@@ -11,4 +11,9 @@ INCOME_STR = 'income'
 ID_STR = 'id'
 DATE_STR = 'date'
 CATEGORY_STR = 'category'
-ACCOUNT_STR = 'account'
\ No newline at end of file
+ACCOUNT_STR = 'account'
+CONTACT_STR = 'contact'
+MERCHANT_ID_STR = 'merchant_id'
+MERCHANT_STR = 'merchant'
+ROW_HASH_STR = 'row_hash'
+LEDGERS_FOLDER = Path("ledgers")
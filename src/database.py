@@ -1,31 +1,538 @@
 import os
+import re
+import hashlib
 import sqlite3
+from pathlib import Path
 import pandas as pd
+import yaml
 from src.constants import *
+from src.merchants import intern_merchants
 
 def get_connection():
+    # The catalog database: merchants, contact ledger and the list of transaction ledgers
     return sqlite3.connect(DB_PATH)
 
+# Transactions are sharded into one SQLite file per statement year ("ledger").
+# Ids are allocated from a per-ledger range so they stay unique across ledgers.
+LEDGER_ID_SPAN = 10 ** 9
+UNDATED_LEDGER = 0
+# Bumped whenever compute_row_hashes changes, so stored hashes are recomputed
+ROW_HASH_VERSION = 3
+
+TRANSACTIONS_TABLE_SQL = '''
+    CREATE {kind} IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY {autoincrement},
+        date TEXT,
+        place TEXT,
+        expense REAL,
+        income REAL,
+        credit_card TEXT,
+        account TEXT,
+        category TEXT,
+        source_file TEXT,
+        active INTEGER,
+        contact TEXT,
+        merchant_id INTEGER,
+        row_hash TEXT
+    )
+'''
+
+LEDGER_COLUMNS = [
+    DATE_STR, PLACE_STR, EXPENSE_STR, INCOME_STR, "credit_card", ACCOUNT_STR, CATEGORY_STR,
+    "source_file", "active", CONTACT_STR, MERCHANT_ID_STR, ROW_HASH_STR
+]
+
+def ledger_label(ledger):
+    return "undated" if ledger == UNDATED_LEDGER else str(ledger)
+
+def get_ledger_path(ledger):
+    return os.path.join(LEDGERS_FOLDER, f"expenses_{ledger_label(ledger)}.db")
+
+def ledger_for_id(transaction_id):
+    return int(transaction_id) // LEDGER_ID_SPAN
+
+def ledgers_for_dates(dates):
+    return pd.to_datetime(dates, errors="coerce").dt.year.fillna(UNDATED_LEDGER).astype(int)
+
+def get_ledgers(include_frozen=True):
+    with get_connection() as conn:
+        rows = conn.execute("SELECT ledger, frozen FROM ledgers ORDER BY ledger").fetchall()
+    return [ledger for ledger, frozen in rows if include_frozen or not frozen]
+
+def is_ledger_frozen(ledger):
+    with get_connection() as conn:
+        row = conn.execute("SELECT frozen FROM ledgers WHERE ledger = ?", (int(ledger),)).fetchone()
+    return bool(row and row[0])
+
+def create_ledger_tables(conn, ledger):
+    cursor = conn.cursor()
+    cursor.execute(TRANSACTIONS_TABLE_SQL.format(kind="TABLE", autoincrement="AUTOINCREMENT"))
+    cursor.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'transactions', ? "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'transactions')",
+        (int(ledger) * LEDGER_ID_SPAN,)
+    )
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_row_hash ON transactions(row_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions(category)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_contact ON transactions(contact, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_merchant ON transactions(merchant_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_source_file ON transactions(source_file)")
+    create_transactions_fts(cursor)
+    conn.commit()
+
+def get_ledger_connection(ledger):
+    # Connection to a single ledger file for writes; creates the ledger on first use
+    ledger = int(ledger)
+    if is_ledger_frozen(ledger):
+        raise ValueError(f"Ledger {ledger_label(ledger)} is frozen")
+
+    os.makedirs(LEDGERS_FOLDER, exist_ok=True)
+    conn = sqlite3.connect(get_ledger_path(ledger))
+    with get_connection() as catalog:
+        catalog.execute("INSERT OR IGNORE INTO ledgers (ledger, frozen) VALUES (?, 0)", (ledger,))
+    # Always (idempotently) ensure the schema: the file may be missing even though
+    # the catalog lists the ledger, e.g. when the ledgers folder isn't mounted
+    create_ledger_tables(conn, ledger)
+    return conn
+
+def ledger_connections(ledgers=None):
+    """
+    Yield catalog connections with the selected ledgers ATTACHed read-only and a
+    TEMP view named transactions over their UNION ALL, so queries against
+    transactions span the ledgers. Ledgers are split into several connections
+    if there are more than SQLite's ATTACH limit.
+    """
+    if ledgers is None:
+        ledgers = get_ledgers()
+    ledgers = sorted(int(l) for l in ledgers if os.path.exists(get_ledger_path(l)))
+
+    probe = sqlite3.connect(":memory:")
+    attach_limit = probe.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(probe, "getlimit") else 10
+    probe.close()
+
+    chunks = [ledgers[i:i + attach_limit] for i in range(0, len(ledgers), attach_limit)] or [[]]
+    for chunk in chunks:
+        conn = sqlite3.connect(get_connection_uri(DB_PATH), uri=True)
+        try:
+            for ledger in chunk:
+                conn.execute(
+                    f"ATTACH DATABASE ? AS ledger_{ledger}",
+                    (get_connection_uri(get_ledger_path(ledger), read_only=True),)
+                )
+            if chunk:
+                union = " UNION ALL ".join(f"SELECT * FROM ledger_{ledger}.transactions" for ledger in chunk)
+                conn.execute(f"CREATE TEMP VIEW transactions AS {union}")
+            else:
+                # No ledgers yet; queries see an empty transactions table
+                conn.execute(TRANSACTIONS_TABLE_SQL.format(kind="TEMP TABLE", autoincrement=""))
+            yield conn, chunk
+        finally:
+            conn.close()
+
+def get_connection_uri(path, read_only=False):
+    uri = Path(path).resolve().as_uri()
+    return f"{uri}?mode=ro" if read_only else uri
+
+def read_ledgers(sql, params=(), ledgers=None):
+    # Run a row-level query against the transactions view of the selected ledgers
+    frames = [pd.read_sql_query(sql, conn, params=params) for conn, _ in ledger_connections(ledgers)]
+    frames = [f for f in frames if not f.empty] or frames[:1]
+    return pd.concat(frames, ignore_index=True)
+
+def get_ledger_counts():
+    counts = {}
+    for conn, attached in ledger_connections():
+        for ledger in attached:
+            counts[ledger] = conn.execute(f"SELECT COUNT(*) FROM ledger_{ledger}.transactions").fetchone()[0]
+    return counts
+
+def freeze_ledger(ledger):
+    # Compact a finished year; frozen ledgers are only ever opened read-only
+    conn = get_ledger_connection(ledger)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'").fetchone():
+            conn.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('optimize')")
+            conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    with get_connection() as catalog:
+        catalog.execute("UPDATE ledgers SET frozen = 1 WHERE ledger = ?", (int(ledger),))
+    print(f"Ledger {ledger_label(ledger)} frozen")
+
+def unfreeze_ledger(ledger):
+    with get_connection() as catalog:
+        catalog.execute("UPDATE ledgers SET frozen = 0 WHERE ledger = ?", (int(ledger),))
+    print(f"Ledger {ledger_label(ledger)} unfrozen")
+
+def get_data_generation():
+    # Bumped on every write to transactions, so cached view results can be keyed on it
+    try:
+        with get_connection() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'data_generation'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+def bump_data_generation():
+    # Only call this when rows actually changed: every bump invalidates all cached views
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('data_generation', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+
 def create_transactions_table():
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ledgers (
+                ledger INTEGER PRIMARY KEY,
+                frozen INTEGER DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS merchants (
                 id INTEGER PRIMARY KEY,
-                date TEXT,
-                place TEXT,
-                expense REAL,
-                income REAL,
-                credit_card TEXT,
-                account TEXT,
-                category TEXT,
-                source_file TEXT,
-                active INTEGER,
-                UNIQUE(date, place, expense, income, credit_card, account)
+                name TEXT UNIQUE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS merchant_places (
+                place TEXT PRIMARY KEY,
+                merchant_id INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS contact_ledger (
+                contact TEXT,
+                trip TEXT,
+                start_date TEXT,
+                owed REAL,
+                paid REAL,
+                PRIMARY KEY(contact, trip)
             )
         ''')
         conn.commit()
 
+    migrate_legacy_transactions()
+    normalize_ledger_dates()
+    move_dated_transactions()
+    rehash_ledgers()
+
+def migrate_legacy_transactions():
+    # Databases from before ledgers kept every transaction in expenses.db
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        legacy = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions'"
+        ).fetchone()
+        if not legacy:
+            return
+
+        # Older databases were created before these columns existed
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(transactions)")]
+        if CONTACT_STR not in columns:
+            cursor.execute("ALTER TABLE transactions ADD COLUMN contact TEXT")
+        if MERCHANT_ID_STR not in columns:
+            cursor.execute("ALTER TABLE transactions ADD COLUMN merchant_id INTEGER")
+        if ROW_HASH_STR not in columns:
+            cursor.execute("ALTER TABLE transactions ADD COLUMN row_hash TEXT")
+        # Statements mix date formats, so parse them per file before hashing and routing by year
+        normalize_source_dates(conn)
+        backfill_row_hashes(conn)
+        backfill_merchant_ids(conn)
+
+        df = pd.read_sql_query(f"SELECT {', '.join(LEDGER_COLUMNS)} FROM transactions ORDER BY id", conn)
+
+    for ledger, ledger_df in df.groupby(ledgers_for_dates(df[DATE_STR])):
+        with get_ledger_connection(ledger) as ledger_conn:
+            insert_transactions(ledger_conn, ledger_df)
+        ledger_conn.close()
+
+    with get_connection() as conn:
+        conn.execute("DROP TABLE IF EXISTS transactions_fts")
+        conn.execute("DROP TABLE transactions")
+        conn.commit()
+        conn.execute("VACUUM")
+    bump_data_generation()
+    print(f"Moved {len(df)} transactions from {DB_PATH} into per-year ledgers")
+
+def insert_transactions(conn, df, batch_size=500, on_batch=None):
+    # Rows already in the ledger (active or inactive) hit the row_hash index and are skipped;
+    # returns the number of rows actually inserted
+    inserted = 0
+    records = df[LEDGER_COLUMNS].astype(object).where(df[LEDGER_COLUMNS].notna(), None)
+    records = list(records.itertuples(index=False, name=None))
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        inserted += conn.executemany(
+            f'''
+            INSERT OR IGNORE INTO transactions ({", ".join(LEDGER_COLUMNS)})
+            VALUES ({", ".join("?" * len(LEDGER_COLUMNS))})
+            ''',
+            batch
+        ).rowcount
+        if on_batch is not None:
+            on_batch(len(batch))
+    return inserted
+
+def normalize_dates(dates):
+    # Store dates as ISO text so they compare and sort correctly in SQL; dates of one
+    # statement share a format, unparseable ones are kept as given
+    parsed = pd.to_datetime(dates, errors="coerce")
+    return parsed.dt.strftime("%Y-%m-%d").where(parsed.notna(), dates)
+
+ISO_DATE_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]"
+
+def normalize_source_dates(conn):
+    # Rewrite non-ISO dates of conn's transactions table one source file at a time,
+    # since each statement has its own format; returns the number of rows rewritten
+    df = pd.read_sql_query(
+        f"SELECT id, date, source_file FROM transactions WHERE date IS NOT NULL AND date NOT GLOB '{ISO_DATE_GLOB}'",
+        conn
+    )
+    if df.empty:
+        return 0
+
+    df["iso_date"] = df.groupby("source_file", dropna=False)[DATE_STR].transform(normalize_dates)
+    updates = df[df["iso_date"] != df[DATE_STR]]
+    conn.executemany(
+        "UPDATE transactions SET date = ? WHERE id = ?",
+        [(d, int(i)) for d, i in updates[["iso_date", ID_STR]].itertuples(index=False)]
+    )
+    conn.commit()
+    return len(updates)
+
+def normalize_ledger_dates():
+    """
+    Rewrite dates stored before ingest normalized them to ISO. This is a one-off
+    format fix, so frozen ledgers are rewritten as well.
+    """
+    changed = 0
+    for ledger in get_ledgers():
+        path = get_ledger_path(ledger)
+        if not os.path.exists(path):
+            continue
+
+        conn = sqlite3.connect(path)
+        try:
+            changed += normalize_source_dates(conn)
+        finally:
+            conn.close()
+
+    if changed:
+        bump_data_generation()
+        print(f"Normalized {changed} transaction dates to ISO format")
+
+def move_dated_transactions():
+    """
+    Move rows of the undated ledger whose date now parses into the ledger for
+    their year. Row hashes are recomputed from the ISO date, so a row that was
+    since re-imported into its year's ledger is dropped instead of doubled.
+    """
+    if UNDATED_LEDGER not in get_ledgers() or is_ledger_frozen(UNDATED_LEDGER):
+        return
+    if not os.path.exists(get_ledger_path(UNDATED_LEDGER)):
+        return
+
+    moved = []
+    conn = get_ledger_connection(UNDATED_LEDGER)
+    try:
+        df = pd.read_sql_query(
+            f"SELECT id, {', '.join(LEDGER_COLUMNS)} FROM transactions WHERE date GLOB '{ISO_DATE_GLOB}' ORDER BY id",
+            conn
+        )
+        if df.empty:
+            return
+
+        # Deactivated duplicates keep their empty hash
+        df[ROW_HASH_STR] = compute_row_hashes(df).where(df[ROW_HASH_STR].notna(), None)
+        for ledger, ledger_df in df.groupby(ledgers_for_dates(df[DATE_STR])):
+            if ledger == UNDATED_LEDGER or is_ledger_frozen(ledger):
+                continue
+
+            target = get_ledger_connection(ledger)
+            try:
+                insert_transactions(target, ledger_df)
+                target.commit()
+            finally:
+                target.close()
+            moved.extend(int(i) for i in ledger_df[ID_STR])
+
+        conn.executemany("DELETE FROM transactions WHERE id = ?", [(i,) for i in moved])
+        conn.commit()
+    finally:
+        conn.close()
+
+    if moved:
+        bump_data_generation()
+        print(f"Moved {len(moved)} dated transactions out of the undated ledger")
+
+def normalize_card(cards):
+    # Card or account number from the statement itself; numeric columns read as "4500.0"
+    return cards.astype(object).where(cards.notna(), "").astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+
+def compute_row_hashes(df):
+    """
+    Hash the canonical identity of each row: ISO date, whitespace- and
+    case-normalized place, expense and income in integer cents, and the
+    statement's card/account number, so overlapping exports of one card saved
+    under different names match. Statements without a card number fall back to
+    the account, keeping e.g. the same fee on checking and savings apart.
+    """
+    date_key = normalize_dates(df[DATE_STR]).astype(str)
+    place_key = df[PLACE_STR].fillna("").astype(str).str.split().str.join(" ").str.lower()
+    expense_cents = (pd.to_numeric(df[EXPENSE_STR], errors="coerce").fillna(0) * 100).round().astype("int64")
+    income_cents = (pd.to_numeric(df[INCOME_STR], errors="coerce").fillna(0) * 100).round().astype("int64")
+    cards = normalize_card(df["credit_card"])
+    source_key = ("card:" + cards).where(cards != "", "account:" + df[ACCOUNT_STR].fillna("").astype(str))
+
+    key = (
+        date_key + "|" + place_key + "|" + expense_cents.astype(str) + "|"
+        + income_cents.astype(str) + "|" + source_key
+    )
+    return key.map(lambda k: hashlib.sha1(k.encode()).hexdigest())
+
+def backfill_row_hashes(conn):
+    """
+    (Re)compute the row hash of every transaction. Rows whose hash an older row
+    already has are duplicates: they are deactivated and left without a hash
+    rather than deleted, so nothing is lost if two rows were wrongly matched.
+    Rows deactivated that way before are reactivated if they no longer match.
+    Returns the number of rows deactivated.
+    """
+    df = pd.read_sql_query(
+        "SELECT id, date, place, expense, income, credit_card, account, active, row_hash FROM transactions",
+        conn
+    )
+    if df.empty:
+        return 0
+
+    # Rows earlier deduplicated have no hash and are inactive; keep the others first
+    df["deduplicated"] = df[ROW_HASH_STR].isna() & (df["active"] == 0)
+    df = df.sort_values(["deduplicated", ID_STR], ignore_index=True)
+    df[ROW_HASH_STR] = compute_row_hashes(df)
+    duplicate = df.duplicated(subset=ROW_HASH_STR)
+    restored = df["deduplicated"] & ~duplicate
+
+    conn.execute("UPDATE transactions SET row_hash = NULL")
+    conn.executemany(
+        "UPDATE transactions SET active = 0 WHERE id = ?", [(int(i),) for i in df.loc[duplicate, ID_STR]]
+    )
+    conn.executemany(
+        "UPDATE transactions SET active = 1 WHERE id = ?", [(int(i),) for i in df.loc[restored, ID_STR]]
+    )
+    conn.executemany(
+        "UPDATE transactions SET row_hash = ? WHERE id = ?",
+        [(h, int(i)) for h, i in df.loc[~duplicate, [ROW_HASH_STR, ID_STR]].itertuples(index=False)]
+    )
+    newly_deactivated = duplicate & ~df["deduplicated"]
+    if newly_deactivated.any():
+        print(f"Deactivated {int(newly_deactivated.sum())} duplicate transactions")
+    if restored.any():
+        print(f"Reactivated {int(restored.sum())} transactions that are no longer duplicates")
+    return int(newly_deactivated.sum())
+
+def rehash_ledgers():
+    # Re-key every ledger after the row hash definition changed; a one-off
+    # migration, so frozen ledgers are rewritten as well
+    with get_connection() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'row_hash_version'").fetchone()
+    if row and row[0] >= ROW_HASH_VERSION:
+        return
+
+    ledgers = [l for l in get_ledgers() if os.path.exists(get_ledger_path(l))]
+    for ledger in ledgers:
+        conn = sqlite3.connect(get_ledger_path(ledger))
+        try:
+            backfill_row_hashes(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('row_hash_version', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (ROW_HASH_VERSION,)
+        )
+    if ledgers:
+        bump_data_generation()
+
+def backfill_merchant_ids(conn):
+    places = [row[0] for row in conn.execute(
+        "SELECT DISTINCT place FROM transactions WHERE merchant_id IS NULL AND place IS NOT NULL"
+    )]
+    if not places:
+        return
+
+    merchant_ids = intern_merchants(conn, places)
+    conn.executemany(
+        "UPDATE transactions SET merchant_id = ? WHERE place = ? AND merchant_id IS NULL",
+        [(merchant_id, place) for place, merchant_id in merchant_ids.items()]
+    )
+
+def create_transactions_fts(cursor):
+    # Trigram full-text index over place, kept in sync with transactions by triggers
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"
+    ).fetchone()
+    if exists:
+        return
+
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE transactions_fts USING fts5(
+                place, content='transactions', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # FTS5 or the trigram tokenizer (SQLite 3.34+) is missing; search falls back to LIKE
+        print(f"Full-text index unavailable: {e}")
+        return
+
+    cursor.executescript('''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO transactions_fts(rowid, place) VALUES (new.id, new.place);
+        END;
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+            INSERT INTO transactions_fts(transactions_fts, rowid, place) VALUES ('delete', old.id, old.place);
+        END;
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF place ON transactions BEGIN
+            INSERT INTO transactions_fts(transactions_fts, rowid, place) VALUES ('delete', old.id, old.place);
+            INSERT INTO transactions_fts(rowid, place) VALUES (new.id, new.place);
+        END;
+    ''')
+    cursor.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')")
+
+def load_contacts(contacts_path=None):
+    if contacts_path is None:
+        contacts_path = CONTACTS_PATH
+
+    if not os.path.exists(contacts_path):
+        return []
+
+    with open(contacts_path, "r") as f:
+        return (yaml.safe_load(f) or {}).get("contacts", []) or []
+
+def match_contact(place, contacts):
+    place_lower = str(place).lower()
+
+    for contact in contacts:
+        keyword = str(contact.get("keyword") or "").strip().lower()
+        if keyword and keyword in place_lower:
+            return contact[NAME_STR]
+
+    return None
+
 def categorize_transaction(place, config):
     place_lower = str(place).lower()
 
@@ -48,118 +555,172 @@ def categorize_transaction(place, config):
     return "uncategorized"
 
 
-def update_database(mode, csv_filename, config):
+def update_database(mode, csv_filename, config, on_progress=None, on_error=None, rebuild_contacts=True):
     full_path = os.path.join(DATA_FOLDER, csv_filename)
     filename = os.path.basename(full_path)
     account_name = os.path.splitext(filename)[0]  # Remove .csv extension
 
+    def report_error(message):
+        print(message)
+        if on_error is not None:
+            on_error(message)
+
     if mode not in {"add", "remove", "deactivate"}:
         print(f"Unsupported mode: {mode}")
         return
 
-    # Handle remove
-    if mode == "remove":
-        with get_connection() as conn:
-            conn.execute("DELETE FROM transactions WHERE source_file = ?", (filename,))
-            conn.commit()
-            conn.execute("VACUUM")
-        print(f"Database removed rows from file: {filename}")
-        return
+    # Handle remove / deactivate in every ledger the file touched
+    if mode in {"remove", "deactivate"}:
+        rows_changed = 0
+        for ledger in get_ledgers():
+            if is_ledger_frozen(ledger):
+                report_error(f"Ledger {ledger_label(ledger)} is frozen; its rows from {filename} were kept")
+                continue
 
-    # Handle deactivate
-    if mode == "deactivate":
-        with get_connection() as conn:
-            conn.execute("UPDATE transactions SET active = 0 WHERE source_file = ?", (filename,))
-            conn.commit()
-        print(f"Database deactivated rows from file: {filename}")
+            conn = get_ledger_connection(ledger)
+            try:
+                if mode == "remove":
+                    changed = conn.execute("DELETE FROM transactions WHERE source_file = ?", (filename,)).rowcount
+                    conn.commit()
+                    if changed:
+                        conn.execute("VACUUM")
+                else:
+                    changed = conn.execute(
+                        "UPDATE transactions SET active = 0 WHERE source_file = ?", (filename,)
+                    ).rowcount
+                    conn.commit()
+                rows_changed += changed
+            finally:
+                conn.close()
+        if on_progress is not None:
+            on_progress(rows_changed, rows_changed)
+        if rows_changed:
+            bump_data_generation()
+            if rebuild_contacts:
+                rebuild_contact_ledger()
+        print(f"Database {'removed' if mode == 'remove' else 'deactivated'} rows from file: {filename}")
         return
 
     # Handle add
     column_names = [DATE_STR, PLACE_STR, EXPENSE_STR, INCOME_STR, "credit_card"]
 
     if not os.path.isfile(full_path):
-        print(f"File not found: {full_path}")
+        report_error(f"File not found: {full_path}")
         return
 
     try:
         df = pd.read_csv(full_path, header=None, names=column_names)
     except Exception as e:
-        print(f"Failed to read CSV: {full_path}\nError: {e}")
+        report_error(f"Failed to read CSV: {full_path}\nError: {e}")
         return
 
     required_cols = [DATE_STR, PLACE_STR, EXPENSE_STR, INCOME_STR, "credit_card"]
     missing_cols = [col for col in required_cols if col not in df.columns]
     if missing_cols:
-        print(f"CSV file {full_path} missing required columns: {missing_cols}")
+        report_error(f"CSV file {full_path} missing required columns: {missing_cols}")
         return
 
     df = df.dropna(subset=[EXPENSE_STR, INCOME_STR], how="all")
+    df[DATE_STR] = normalize_dates(df[DATE_STR])
 
-    # Categorize
-    df[CATEGORY_STR] = df[PLACE_STR].apply(lambda place: categorize_transaction(place, config))
+    # Categorize, once per unique place
+    category_by_place = {place: categorize_transaction(place, config) for place in df[PLACE_STR].unique()}
+    df[CATEGORY_STR] = df[PLACE_STR].map(category_by_place)
     df["source_file"] = filename
     df[ACCOUNT_STR] = account_name
 
+    # Tag incoming transfers with the contact they came from, once per unique place
+    contacts = load_contacts()
+    income_places = df.loc[df[INCOME_STR] > 0, PLACE_STR].unique()
+    contact_by_place = {place: match_contact(place, contacts) for place in income_places}
+    df[CONTACT_STR] = df[PLACE_STR].map(contact_by_place).where(df[INCOME_STR] > 0, None)
+
     # Filter out ignored transactions
     df = df[df[CATEGORY_STR] != "ignore"]
 
+    rows_total = len(df)
+    if on_progress is not None:
+        on_progress(0, rows_total)
+
+    df[ROW_HASH_STR] = compute_row_hashes(df)
+    df["active"] = 1
+
     with get_connection() as conn:
-        for _, row in df.iterrows():
-            # Check if the row already exists and is inactive
-            existing = conn.execute(
-                '''
-                SELECT active FROM transactions
-                WHERE date = ? AND place = ? AND expense = ? AND income = ? AND credit_card = ? AND source_file = ?
-                ''',
-                (
-                    row[DATE_STR], row[PLACE_STR], row[EXPENSE_STR], row[INCOME_STR],
-                    row["credit_card"], row["source_file"]
-                )
-            ).fetchone()
+        merchant_ids = intern_merchants(conn, df[PLACE_STR].dropna().astype(str).unique())
+    df[MERCHANT_ID_STR] = df[PLACE_STR].astype(str).map(merchant_ids)
 
-            if existing is not None:
-                # Skip if the row already exists (active or inactive)
-                continue
+    # Route each row to the ledger for its year
+    rows_processed = 0
+    rows_inserted = 0
+    for ledger, ledger_df in df.groupby(ledgers_for_dates(df[DATE_STR])):
+        if is_ledger_frozen(ledger):
+            report_error(f"Ledger {ledger_label(ledger)} is frozen; skipped {len(ledger_df)} rows from {filename}")
+            rows_processed += len(ledger_df)
+            continue
 
-            try:
-                conn.execute(
-                    '''
-                    INSERT INTO transactions
-                    (date, place, expense, income, credit_card, account, category, source_file, active)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''',
-                    (
-                        row[DATE_STR], row[PLACE_STR], row[EXPENSE_STR], row[INCOME_STR],
-                        row["credit_card"], row[ACCOUNT_STR], row[CATEGORY_STR], row["source_file"], 1
-                    )
-                )
-            except Exception as e:
-                print(f"Error inserting row from {filename}: {e}")
-    print(f"Database added file: {filename}")
+        def on_batch(batch_rows):
+            nonlocal rows_processed
+            rows_processed += batch_rows
+            if on_progress is not None:
+                on_progress(rows_processed, rows_total)
+
+        conn = get_ledger_connection(ledger)
+        try:
+            rows_inserted += insert_transactions(conn, ledger_df, on_batch=on_batch)
+            conn.commit()
+        except Exception as e:
+            report_error(f"Error inserting rows for ledger {ledger_label(ledger)} from {filename}: {e}")
+        finally:
+            conn.close()
+
+    if on_progress is not None:
+        on_progress(rows_total, rows_total)
+    # Re-adding an already imported file changes nothing, so cached views stay valid
+    if rows_inserted:
+        bump_data_generation()
+        if rebuild_contacts:
+            rebuild_contact_ledger()
+    print(f"Database added file: {filename} ({rows_inserted} new rows)")
 
 
 def bootstrap_database(data_folder, config):
     create_transactions_table()
     for file in os.listdir(data_folder):
         if file.endswith(".csv"):
-            update_database("add", file, config)
+            update_database("add", file, config, rebuild_contacts=False)
+    # One contact ledger rebuild for the whole folder rather than one per file
+    rebuild_contact_ledger()
 
-def get_dataframe_from_database():
-    with get_connection() as conn:
-        df = pd.read_sql_query("SELECT * FROM transactions WHERE active = 1", conn)
-    return df
+def get_dataframe_from_database(ledgers=None):
+    return read_ledgers(
+        """
+        SELECT t.*, m.name AS merchant FROM transactions t
+        LEFT JOIN merchants m ON m.id = t.merchant_id
+        WHERE t.active = 1
+        """,
+        ledgers=ledgers
+    )
 
 def update_transaction_category_db(transaction_id, new_category):
-    with get_connection() as conn:
+    # Returns True if the transaction was updated
+    ledger = ledger_for_id(transaction_id)
+    if is_ledger_frozen(ledger):
+        print(f"Ledger {ledger_label(ledger)} is frozen; transaction ID {transaction_id} was not updated")
+        return False
+
+    updated = False
+    conn = get_ledger_connection(ledger)
+    with conn:
         cursor = conn.cursor()
         try:
             cursor.execute("""
                 UPDATE transactions
                 SET category = ?
                 WHERE id = ? AND active = 1
-            """, (new_category, transaction_id))
+            """, (new_category, int(transaction_id)))
             
-            if cursor.rowcount == 0:
+            updated = cursor.rowcount > 0
+            if not updated:
                 print(f"No active transaction found with ID {transaction_id}")
             else:
                 print(f"Updated transaction ID {transaction_id} to category '{new_category}'")
@@ -167,15 +728,250 @@ def update_transaction_category_db(transaction_id, new_category):
             conn.commit()
         except sqlite3.Error as e:
             print(f"Database error while updating category: {e}")
+    conn.close()
+    if updated:
+        bump_data_generation()
+    return updated
+
+def update_transactions_category_db(category_by_id):
+    updates_by_ledger = {}
+    for transaction_id, category in category_by_id.items():
+        updates_by_ledger.setdefault(ledger_for_id(transaction_id), []).append((category, int(transaction_id)))
+
+    rows_updated = 0
+    for ledger, updates in updates_by_ledger.items():
+        if is_ledger_frozen(ledger):
+            print(f"Ledger {ledger_label(ledger)} is frozen; {len(updates)} transactions were not updated")
+            continue
+
+        conn = get_ledger_connection(ledger)
+        try:
+            rows_updated += conn.executemany(
+                "UPDATE transactions SET category = ? WHERE id = ? AND active = 1", updates
+            ).rowcount
+            conn.commit()
+            print(f"Updated categories of {len(updates)} transactions in ledger {ledger_label(ledger)}")
+        except sqlite3.Error as e:
+            print(f"Database error while updating categories: {e}")
+        finally:
+            conn.close()
+    if rows_updated:
+        bump_data_generation()
 
 def refresh_database(data_folder, config):
-    # Delete all rows
-    with get_connection() as conn:
-        conn.execute("DELETE FROM transactions")
-        conn.commit()
-        conn.execute("VACUUM")
+    # Delete all rows from every ledger that is not frozen
+    rows_deleted = 0
+    for ledger in get_ledgers(include_frozen=False):
+        conn = get_ledger_connection(ledger)
+        try:
+            rows_deleted += conn.execute("DELETE FROM transactions").rowcount
+            conn.commit()
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    if rows_deleted:
+        bump_data_generation()
     print("Database cleared")
 
     # Re-bootstrap all CSVs
     bootstrap_database(data_folder, config)
-    print("Database reloaded from CSVs")
\ No newline at end of file
+    print("Database reloaded from CSVs")
+
+def tag_transaction_contacts(contacts=None):
+    # Re-tag existing income rows, e.g. after a contact was added or its keyword changed
+    if contacts is None:
+        contacts = load_contacts()
+
+    # The first matching contact wins, as at ingest; only rows whose tag changes are written
+    whens, params = [], []
+    for contact in contacts:
+        keyword = str(contact.get("keyword") or "").strip().lower()
+        if keyword:
+            whens.append("WHEN income > 0 AND instr(lower(place), ?) > 0 THEN ?")
+            params.extend([keyword, contact[NAME_STR]])
+    new_contact = f"CASE {' '.join(whens)} ELSE NULL END" if whens else "NULL"
+
+    rows_changed = 0
+    for ledger in get_ledgers(include_frozen=False):
+        conn = get_ledger_connection(ledger)
+        try:
+            rows_changed += conn.execute(
+                f"UPDATE transactions SET contact = {new_contact} WHERE contact IS NOT {new_contact}",
+                params * 2
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+
+    if rows_changed:
+        bump_data_generation()
+    rebuild_contact_ledger(contacts)
+
+def rebuild_contact_ledger(contacts=None):
+    """
+    Recompute what each contact owes per trip and how much they paid back.
+
+    Trip totals come from one grouped query on the category index and repayments
+    from one query on the contact index. A trip shared by several contacts is
+    split evenly between them. Repayments made on or after a contact's first
+    trip are applied to their trips oldest first.
+    """
+    if contacts is None:
+        contacts = load_contacts()
+
+    trips_by_contact = {c[NAME_STR]: list(c.get("trips") or []) for c in contacts if c.get("trips")}
+    all_trips = sorted({trip for trips in trips_by_contact.values() for trip in trips})
+
+    if not all_trips:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM contact_ledger")
+        return
+
+    # Partial totals per ledger are combined here
+    placeholders = ",".join("?" * len(all_trips))
+    partial_totals = read_ledgers(
+        f"""
+        SELECT category, MIN(date) AS start_date, SUM(expense) AS total FROM transactions
+        WHERE active = 1 AND category IN ({placeholders})
+        GROUP BY category
+        """,
+        all_trips
+    )
+    totals = partial_totals.groupby(CATEGORY_STR).agg(start_date=("start_date", "min"), total=("total", "sum"))
+    trip_totals = {
+        trip: (row.start_date, row.total or 0.0)
+        for trip, row in totals.iterrows()
+    }
+    sharers = {trip: sum(trip in trips for trips in trips_by_contact.values()) for trip in all_trips}
+
+    names = list(trips_by_contact)
+    placeholders = ",".join("?" * len(names))
+    repayments = {}
+    for name, date, income in read_ledgers(
+        f"""
+        SELECT contact, date, income FROM transactions
+        WHERE active = 1 AND income > 0 AND contact IN ({placeholders})
+        """,
+        names
+    ).itertuples(index=False):
+        repayments.setdefault(name, []).append((date, income))
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM contact_ledger")
+
+        ledger_rows = []
+        for name, trips in trips_by_contact.items():
+            entries = []
+            for trip in trips:
+                start_date, total = trip_totals.get(trip, (None, 0.0))
+                entries.append([trip, start_date, total / sharers[trip], 0.0])
+            entries.sort(key=lambda e: (e[1] is None, e[1] or ""))
+
+            first_start = next((e[1] for e in entries if e[1] is not None), None)
+            remaining = sum(
+                income for date, income in repayments.get(name, [])
+                if first_start is not None and date >= first_start
+            )
+            for entry in entries:
+                entry[3] = min(entry[2], remaining)
+                remaining -= entry[3]
+            if remaining > 0 and entries:
+                # Overpayments stay on the most recent trip
+                entries[-1][3] += remaining
+
+            ledger_rows.extend((name, trip, start_date, owed, paid) for trip, start_date, owed, paid in entries)
+
+        conn.executemany(
+            "INSERT INTO contact_ledger (contact, trip, start_date, owed, paid) VALUES (?, ?, ?, ?, ?)",
+            ledger_rows
+        )
+        conn.commit()
+
+def get_contact_ledger(contact):
+    with get_connection() as conn:
+        df = pd.read_sql_query(
+            """
+            SELECT trip, start_date, owed, paid, owed - paid AS outstanding
+            FROM contact_ledger WHERE contact = ?
+            ORDER BY start_date
+            """,
+            conn,
+            params=(contact,)
+        )
+    return df
+
+def get_contact_repayments(contact, ledgers=None):
+    return read_ledgers(
+        """
+        SELECT id, date, place, income FROM transactions
+        WHERE active = 1 AND income > 0 AND contact = ?
+        ORDER BY date
+        """,
+        (contact,),
+        ledgers=ledgers
+    )
+
+def parse_search_query(query):
+    """
+    Split a search string into terms. Double-quoted text is kept as one phrase
+    and a trailing * marks a prefix term, e.g. 'amazon "prime video" uber*'.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        term = (phrase or word).strip().lower()
+        if term:
+            terms.append(term)
+    return terms
+
+def starts_word(place, prefix):
+    # 1 when prefix starts the place or one of its words
+    return int(re.search(r"(?<![a-z0-9])" + re.escape(prefix), str(place or "").lower()) is not None)
+
+def search_transactions(query, limit=None, active_only=True, ledgers=None):
+    terms = parse_search_query(query)
+    if not terms:
+        return get_dataframe_from_database(ledgers)
+
+    # Trigram matching is substring matching: match on the stem of a prefix term,
+    # then keep rows where the stem starts a word
+    prefixes = [term.rstrip("*") for term in terms if term.endswith("*") and term.rstrip("*")]
+    terms = [term.rstrip("*") or term for term in terms]
+    fts_query = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    like_condition = " AND ".join("instr(lower(t.place), ?) > 0" for _ in terms)
+    active_condition = " AND t.active = 1" if active_only else ""
+    active_condition += "".join(" AND starts_word(t.place, ?)" for _ in prefixes)
+
+    frames = []
+    for conn, attached in ledger_connections(ledgers):
+        conn.create_function("starts_word", 2, starts_word, deterministic=True)
+        selects, params = [], []
+        for ledger in attached:
+            schema = f"ledger_{ledger}"
+            has_fts = conn.execute(
+                f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"
+            ).fetchone()
+
+            # Trigrams cannot match terms shorter than three characters
+            if has_fts and all(len(term) >= 3 for term in terms):
+                selects.append(
+                    f"SELECT t.* FROM {schema}.transactions_fts f JOIN {schema}.transactions t ON t.id = f.rowid "
+                    f"WHERE f.transactions_fts MATCH ?{active_condition}"
+                )
+                params.append(fts_query)
+            else:
+                selects.append(f"SELECT t.* FROM {schema}.transactions t WHERE {like_condition}{active_condition}")
+                params.extend(terms)
+            params.extend(prefixes)
+
+        if not selects:
+            selects.append(f"SELECT t.* FROM transactions t WHERE {like_condition}{active_condition}")
+            params.extend(terms + prefixes)
+
+        sql = f"SELECT * FROM ({' UNION ALL '.join(selects)}) ORDER BY date DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        frames.append(pd.read_sql_query(sql, conn, params=params))
+
+    df = pd.concat(frames, ignore_index=True).sort_values(DATE_STR, ascending=False, ignore_index=True)
+    return df if limit is None else df.head(limit)
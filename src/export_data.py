@@ -0,0 +1,185 @@
+import os
+import glob
+import time
+import tempfile
+import streamlit as st
+import pandas as pd
+
+from src.constants import *
+from src.database import ledger_connections, read_ledgers
+
+EXPORT_BATCH_SIZE = 10000
+EXPORT_FORMATS = {"CSV": ".csv", "Parquet": ".parquet"}
+EXPORT_PREFIX = "expenses_export_"
+# Prepared exports older than this are deleted, e.g. those of sessions that ended
+EXPORT_MAX_AGE = 60 * 60
+
+
+def build_export_query(category=None, date_range=None, account=None, source_file=None):
+    # Same filters as load_and_filter_data, pushed down into SQLite; dates are stored as ISO text
+    conditions = ["t.active = 1"]
+    params = []
+
+    if category:
+        conditions.append("t.category = ?")
+        params.append(category)
+    if date_range:
+        conditions.append("t.date >= ? AND t.date <= ?")
+        params.extend(pd.to_datetime(d).strftime("%Y-%m-%d") for d in date_range)
+    if account:
+        conditions.append("t.account = ?")
+        params.append(account)
+    if source_file:
+        conditions.append("t.source_file = ?")
+        params.append(source_file)
+
+    sql = f"""
+        SELECT t.*, m.name AS merchant FROM transactions t
+        LEFT JOIN merchants m ON m.id = t.merchant_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY t.date, t.id
+    """
+    return sql, params
+
+
+def iter_transactions(category=None, date_range=None, account=None, source_file=None, ledgers=None,
+                      batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield the matching transactions as DataFrames of at most batch_size rows,
+    so exports never hold the whole result in memory.
+    """
+    sql, params = build_export_query(category, date_range, account, source_file)
+    for conn, _ in ledger_connections(ledgers):
+        for batch in pd.read_sql_query(sql, conn, params=params, chunksize=batch_size):
+            yield batch
+
+
+def export_csv(destination, batch_size=EXPORT_BATCH_SIZE, **filters):
+    rows = 0
+    header = True
+    for batch in iter_transactions(batch_size=batch_size, **filters):
+        batch.to_csv(destination, mode="w" if header else "a", header=header, index=False)
+        header = False
+        rows += len(batch)
+
+    if header:
+        # No rows matched; still write the header
+        ledgers = filters.pop("ledgers", None)
+        sql, params = build_export_query(**filters)
+        read_ledgers(sql + " LIMIT 0", params, ledgers=ledgers).to_csv(destination, index=False)
+    return rows
+
+
+def export_parquet(destination, batch_size=EXPORT_BATCH_SIZE, **filters):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    # Fixed schema so every batch is written with the same column types
+    schema = pa.schema([
+        (ID_STR, pa.int64()),
+        (DATE_STR, pa.string()),
+        (PLACE_STR, pa.string()),
+        (EXPENSE_STR, pa.float64()),
+        (INCOME_STR, pa.float64()),
+        ("credit_card", pa.string()),
+        (ACCOUNT_STR, pa.string()),
+        (CATEGORY_STR, pa.string()),
+        ("source_file", pa.string()),
+        ("active", pa.int64()),
+        (CONTACT_STR, pa.string()),
+        (MERCHANT_ID_STR, pa.int64()),
+        (ROW_HASH_STR, pa.string()),
+        (MERCHANT_STR, pa.string()),
+    ])
+
+    rows = 0
+    with pq.ParquetWriter(destination, schema) as writer:
+        for batch in iter_transactions(batch_size=batch_size, **filters):
+            for field in schema:
+                if pa.types.is_string(field.type):
+                    batch[field.name] = batch[field.name].astype("string")
+            writer.write_table(pa.Table.from_pandas(batch[schema.names], schema=schema, preserve_index=False))
+            rows += len(batch)
+    return rows
+
+
+def get_distinct_values(column, ledgers=None):
+    df = read_ledgers(
+        f"SELECT DISTINCT {column} FROM transactions WHERE active = 1 AND {column} IS NOT NULL",
+        ledgers=ledgers
+    )
+    return sorted(df[column].drop_duplicates().tolist())
+
+
+def cleanup_exports(keep=None):
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), f"{EXPORT_PREFIX}*")):
+        if path != keep and time.time() - os.path.getmtime(path) > EXPORT_MAX_AGE:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def read_export(path):
+    # Called by the download button only when it is clicked
+    with open(path, "rb") as f:
+        return f.read()
+
+def export_data_page(category_config):
+    st.title("📦 Export Data")
+    cleanup_exports(keep=st.session_state.get("export_path"))
+
+    categories = ["-- Any --"] + sorted(list(category_config.get("spending_categories", {}).keys()) + [INCOME_STR, "uncategorized"])
+    selected_category = st.selectbox("Category", options=categories)
+    date_range = st.date_input("Optional Date Range Filter", [])
+    ledgers = st.session_state.get("selected_ledgers")
+    accounts = ["-- Any --"] + get_distinct_values(ACCOUNT_STR, ledgers)
+    selected_account = st.selectbox("Account", options=accounts)
+    source_files = ["-- Any --"] + get_distinct_values("source_file", ledgers)
+    selected_source_file = st.selectbox("Source file", options=source_files)
+    export_format = st.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+
+    filters = {
+        "category": None if selected_category == "-- Any --" else selected_category,
+        "date_range": tuple(date_range) if len(date_range) == 2 else None,
+        "account": None if selected_account == "-- Any --" else selected_account,
+        "source_file": None if selected_source_file == "-- Any --" else selected_source_file,
+        "ledgers": ledgers,
+    }
+
+    if st.button("Prepare Export"):
+        # Stream to a file on disk rather than building the extract in memory
+        suffix = EXPORT_FORMATS[export_format]
+        fd, path = tempfile.mkstemp(prefix=EXPORT_PREFIX, suffix=suffix)
+        os.close(fd)
+        try:
+            with st.spinner("Exporting..."):
+                if export_format == "Parquet":
+                    rows = export_parquet(path, **filters)
+                else:
+                    rows = export_csv(path, **filters)
+        except ImportError as e:
+            st.error(str(e))
+            os.remove(path)
+            return
+
+        previous = st.session_state.get("export_path")
+        if previous and previous != path and os.path.exists(previous):
+            os.remove(previous)
+        st.session_state.export_path = path
+        st.session_state.export_rows = rows
+
+    path = st.session_state.get("export_path")
+    if path and os.path.exists(path):
+        st.success(f"Export ready: {st.session_state.export_rows} transactions.")
+        # Streamlit serves downloads from memory, so the file is only read once the
+        # button is clicked; very large exports still need that much memory for the download
+        st.caption(f"File size: {os.path.getsize(path) / 1024 ** 2:.1f} MB")
+        st.download_button(
+            "⬇️ Download",
+            lambda: read_export(path),
+            file_name=f"expenses{os.path.splitext(path)[1]}",
+            on_click="ignore"
+        )
@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+import uuid
+
+from src.database import update_database
+
+# Streamlit re-runs the page script on every interaction but imports this module
+# once per server process, so the queue and worker outlive any single rerun.
+_jobs = {}
+_jobs_lock = threading.Lock()
+_job_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+MAX_FINISHED_JOBS = 50
+
+
+def _update_job(job_id, **fields):
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+
+
+def _run_job(job_id, mode, filename, config):
+    def on_progress(rows_processed, rows_total):
+        _update_job(job_id, rows_processed=rows_processed, rows_total=rows_total)
+
+    def on_error(message):
+        with _jobs_lock:
+            _jobs[job_id]["errors"].append(message)
+
+    _update_job(job_id, status="running", started_at=time.time())
+    try:
+        update_database(mode, filename, config, on_progress=on_progress, on_error=on_error)
+    except Exception as e:
+        on_error(f"{mode.capitalize()} of {filename} failed: {e}")
+
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job["status"] = "failed" if job["errors"] and not job["rows_processed"] else "done"
+        job["finished_at"] = time.time()
+
+
+def _worker_loop():
+    # A single worker keeps SQLite writes serialized, and jobs on the same file run in order
+    while True:
+        job_id, mode, filename, config = _job_queue.get()
+        try:
+            _run_job(job_id, mode, filename, config)
+        finally:
+            _job_queue.task_done()
+            _prune_finished_jobs()
+
+
+def _prune_finished_jobs():
+    with _jobs_lock:
+        finished = [j for j in _jobs.values() if j["status"] in {"done", "failed"}]
+        finished.sort(key=lambda j: j["finished_at"])
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            del _jobs[job["id"]]
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="ingest-worker", daemon=True)
+            _worker.start()
+
+
+def enqueue_job(mode, filename, config):
+    # mode is an update_database mode: "add", "remove" or "deactivate"
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _jobs[job_id] = {
+            "id": job_id,
+            "mode": mode,
+            "file": filename,
+            "status": "queued",
+            "rows_processed": 0,
+            "rows_total": None,
+            "errors": [],
+            "enqueued_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+
+    _ensure_worker()
+    _job_queue.put((job_id, mode, filename, config))
+    return job_id
+
+
+def enqueue_upload(filename, config):
+    return enqueue_job("add", filename, config)
+
+
+def enqueue_removal(filename, config):
+    return enqueue_job("remove", filename, config)
+
+
+def get_jobs():
+    with _jobs_lock:
+        jobs = [dict(job, errors=list(job["errors"])) for job in _jobs.values()]
+    return sorted(jobs, key=lambda j: j["enqueued_at"], reverse=True)
+
+
+def has_active_jobs():
+    with _jobs_lock:
+        return any(job["status"] in {"queued", "running"} for job in _jobs.values())
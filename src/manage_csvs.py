@@ -3,6 +3,42 @@ import os
 import pandas as pd
 from src.constants import *
 from src.database import *
+from src.ingest_queue import enqueue_upload, enqueue_removal, get_jobs, has_active_jobs
+
+def show_ingest_jobs():
+    # Poll the worker while jobs are pending, then do one full rerun to refresh the page
+    active = has_active_jobs()
+
+    @st.fragment(run_every=1 if active else None)
+    def ingest_status():
+        jobs = get_jobs()
+        if not jobs:
+            return
+
+        st.markdown("### ⏳ Database Jobs")
+        status_df = pd.DataFrame([
+            {
+                "file": job["file"],
+                "job": job["mode"],
+                "status": job["status"],
+                "rows processed": job["rows_processed"],
+                "rows total": job["rows_total"],
+                "errors": len(job["errors"]),
+            }
+            for job in jobs
+        ])
+        st.dataframe(status_df, use_container_width=True, hide_index=True)
+
+        for job in jobs:
+            if job["errors"]:
+                with st.expander(f"Errors for {job['file']}"):
+                    for message in job["errors"]:
+                        st.error(message)
+
+        if active and not has_active_jobs():
+            st.rerun()
+
+    ingest_status()
 
 def manage_csvs_page(category_config):
     st.title("📤 Upload & Manage Expense Data")
@@ -15,9 +51,9 @@ def manage_csvs_page(category_config):
     if "processed_files" not in st.session_state:
         st.session_state.processed_files = set()
 
-    # Upload a CSV
-    uploaded_file = st.file_uploader("Upload a CSV file", type=["csv"])
-    if uploaded_file is not None:
+    # Upload CSVs; ingestion runs on a background worker so the page stays responsive
+    uploaded_files = st.file_uploader("Upload CSV files", type=["csv"], accept_multiple_files=True)
+    for uploaded_file in uploaded_files or []:
         filename = uploaded_file.name
         filepath = os.path.join(DATA_FOLDER, filename)
 
@@ -25,16 +61,17 @@ def manage_csvs_page(category_config):
             # Save the file
             with open(filepath, "wb") as f:
                 f.write(uploaded_file.getbuffer())
-            st.success(f"{filename} uploaded successfully.")
 
             # Update session state
             if filename not in st.session_state.included_files:
                 st.session_state.included_files.append(filename)
             st.session_state.processed_files.add(filename)
 
-            # Update the database ONCE for this upload
-            update_database("add", filename, category_config)
-            st.success("Database updated with uploaded file.")
+            # Queue the database update ONCE for this upload
+            enqueue_upload(filename, category_config)
+            st.success(f"{filename} uploaded and queued for import.")
+
+    show_ingest_jobs()
 
     # Optional file deletion
     all_csvs = sorted([f for f in os.listdir(DATA_FOLDER) if f.endswith(".csv")])
@@ -43,15 +80,40 @@ def manage_csvs_page(category_config):
     if st.button("Delete Selected Files"):
         for file in files_to_delete:
             os.remove(os.path.join(DATA_FOLDER, file))
-            update_database("remove", file, category_config)
+            # Queued behind any pending import of the same file, so its rows can't come back
+            enqueue_removal(file, category_config)
             if file in st.session_state.included_files:
                 st.session_state.included_files.remove(file)
             if file in st.session_state.processed_files:
                 st.session_state.processed_files.remove(file)
-        st.success("Files deleted.")
+        st.success("Files deleted; their rows are being removed from the database.")
         st.rerun()
 
+    # Ledgers: one database per year; finished years can be frozen read-only
+    st.markdown("### 🗄️ Ledgers")
+    ledgers = get_ledgers()
+    if ledgers:
+        counts = get_ledger_counts()
+        ledger_df = pd.DataFrame({
+            "ledger": [ledger_label(l) for l in ledgers],
+            "transactions": [int(counts.get(l, 0)) for l in ledgers],
+            "frozen": [is_ledger_frozen(l) for l in ledgers],
+        })
+        st.dataframe(ledger_df, use_container_width=True, hide_index=True)
+
+        ledger = st.selectbox("Ledger", ledgers, format_func=ledger_label)
+        if is_ledger_frozen(ledger):
+            if st.button("Unfreeze Ledger"):
+                unfreeze_ledger(ledger)
+                st.rerun()
+        elif st.button("Freeze Ledger (compact & make read-only)"):
+            with st.spinner("Compacting ledger..."):
+                freeze_ledger(ledger)
+            st.rerun()
+    else:
+        st.info("No ledgers yet. Upload a CSV to create one.")
+
     # Show updated data
     st.markdown("### 🔍 Current Database View")
-    db_df = get_dataframe_from_database()
+    db_df = get_dataframe_from_database(st.session_state.get("selected_ledgers"))
     st.dataframe(db_df, use_container_width=True)
\ No newline at end of file
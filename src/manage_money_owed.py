@@ -6,9 +6,15 @@ from src.backend import (
     load_and_filter_data, 
     update_transaction_category_config, 
     load_config_file, 
-    update_contacts_config
+    update_contacts_config,
+    assign_trip_to_contact
+    )
+from src.database import (
+    update_transaction_category_db,
+    rebuild_contact_ledger,
+    get_contact_ledger,
+    get_contact_repayments
     )
-from src.database import update_transaction_category_db
 
 
 def get_trip_expenses(df, start_date, end_date, category=None):
@@ -18,21 +24,9 @@ def get_trip_expenses(df, start_date, end_date, category=None):
         mask &= df[CATEGORY_STR] == category
     return df[mask].copy()
 
-def get_reimbursement_transactions(df, from_who, after_date):
-    df[DATE_STR] = pd.to_datetime(df[DATE_STR])
-    return df[
-        (df[DATE_STR] > pd.to_datetime(after_date)) &
-        (df[INCOME_STR] > 0) &
-        (df[PLACE_STR].str.contains(from_who, case=False, na=False))
-    ]
-
-def calculate_owed_amount(df):
-    return df[EXPENSE_STR].sum()
-
-def calculate_paid_amount(df):
-    return df[INCOME_STR].sum()
+def manage_money_owed(category_config, ledgers=None):
+    st.title("💸 Manage Money Owed")
 
-def manage_money_owed(category_config):
     # Step 1: Category and date filtering
     categories = ["-- Any --"] + sorted(list(category_config.get("spending_categories", {}).keys()) + [INCOME_STR])
     selected_category = st.selectbox(
@@ -50,7 +44,7 @@ def manage_money_owed(category_config):
     else:
         date_filter = None
 
-    expenses = load_and_filter_data(category_filter=category_filter, date_range=date_filter)
+    expenses = load_and_filter_data(category_filter=category_filter, date_range=date_filter, ledgers=ledgers)
     expenses = expenses.copy()  # avoid mutating shared dataframe
     expenses['selected'] = False
 
@@ -78,9 +72,10 @@ def manage_money_owed(category_config):
                     if isinstance(transaction[PLACE_STR], str) and ',' in transaction[PLACE_STR]:
                         transaction[PLACE_STR] = transaction[PLACE_STR].split(',')[0].strip()
 
-                    update_transaction_category_db(transaction, new_category)
+                    update_transaction_category_db(transaction[ID_STR], new_category)
                     update_transaction_category_config(new_category, transaction[PLACE_STR], CATEGORY_CONFIG_PATH)
 
+                rebuild_contact_ledger()
                 st.success(f"Assigned {len(selected_ids)} transactions to '{new_category}' and updated config.")
             else:
                 st.warning("No transactions selected.")
@@ -110,29 +105,30 @@ def manage_money_owed(category_config):
 
     trip_category = st.session_state.get("current_trip_category")
     if contact and trip_category:
-        trip_df = load_and_filter_data(category_filter=trip_category)
-        total_trip_expenses = trip_df[EXPENSE_STR].sum()
-
-        income_df  = load_and_filter_data(category_filter="Income")
-        after_date = income_df[DATE_STR].min() if not income_df.empty else None
-        if after_date:
-            payments_df = get_reimbursement_transactions(income_df,from_who=contact, after_date=after_date)
-            total_repaid = payments_df[INCOME_STR].sum()
-        else:
-            payments_df = pd.DataFrame()
-            total_repaid = 0.0
+        if st.button(f"Add '{trip_category}' to {contact}'s trips"):
+            assign_trip_to_contact(contacts, contact, trip_category)
+            st.success(f"{contact} now shares '{trip_category}'.")
+
+    if contact:
+        ledger_df = get_contact_ledger(contact)
+        if ledger_df.empty:
+            st.warning("Assign a trip to this contact to compute amounts.")
+            return
+
+        total_owed = ledger_df["owed"].sum()
+        total_repaid = ledger_df["paid"].sum()
 
         col1, col2, col3 = st.columns(3)
-        col1.metric("Total Owed", f"${total_trip_expenses:,.2f}")
+        col1.metric("Total Owed", f"${total_owed:,.2f}")
         col2.metric("Paid Back", f"${total_repaid:,.2f}")
-        col3.metric("Still Owed", f"${(total_trip_expenses - total_repaid):,.2f}")
+        col3.metric("Still Owed", f"${(total_owed - total_repaid):,.2f}")
+        st.dataframe(ledger_df, use_container_width=True, hide_index=True)
 
+        payments_df = get_contact_repayments(contact, ledgers)
         if not payments_df.empty:
             with st.expander("View Payment Transactions"):
-                st.dataframe(payments_df[[DATE_STR, 'amount', 'description']], use_container_width=True)
+                st.dataframe(payments_df[[DATE_STR, PLACE_STR, INCOME_STR]], use_container_width=True)
         else:
             st.info("No reimbursement transactions found.")
-    elif contact:
-        st.warning("Assign to a trip first to compute amounts.")
     else:
-        st.info("Enter a contact name to calculate repayments.")
\ No newline at end of file
+        st.info("Enter a contact name to calculate repayments.")
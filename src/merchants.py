@@ -0,0 +1,85 @@
+import re
+
+# Prefixes card processors put in front of the real merchant, e.g. "SQ *COFFEE SHOP"
+PROCESSOR_PREFIX_RE = re.compile(
+    r"^(?:sq|sqsp|tst|sp|pp|paypal|pypl|ckd|fs|ic|zettle|sumup)\s*\*\s*"
+)
+# Store numbers and reference codes: "#1234", "000000114295", "2K4X21"
+REFERENCE_TOKEN_RE = re.compile(r"^#|\d.*\d")
+LOCATION_CODES = {
+    # Canadian provinces & territories
+    "ab", "bc", "mb", "nb", "nl", "ns", "nt", "nu", "on", "pe", "qc", "sk", "yt",
+    # US states
+    "al", "ak", "az", "ar", "ca", "co", "ct", "de", "fl", "ga", "hi", "id", "il", "in", "ia",
+    "ks", "ky", "la", "me", "md", "ma", "mi", "mn", "ms", "mo", "mt", "ne", "nv", "nh", "nj",
+    "nm", "ny", "nc", "nd", "oh", "ok", "or", "pa", "ri", "sc", "sd", "tn", "tx", "ut", "vt",
+    "va", "wa", "wv", "wi", "wy", "dc",
+}
+
+
+def normalize_merchant(place):
+    """
+    Reduce a raw transaction place to a merchant name, e.g.
+    "SQ *COFFEE CO #221 TORONTO, ON" -> "coffee co".
+    """
+    raw = " ".join(str(place).lower().split())
+
+    name = PROCESSOR_PREFIX_RE.sub("", raw)
+    # "AMAZON.CA*2K4X21" style merchant*reference
+    name = name.split("*")[0]
+    # "MERCHANT, CITY PROVINCE"
+    name = name.split(",")[0]
+
+    tokens = name.split()
+    # Everything after a store number is location
+    cut = next((i for i, t in enumerate(tokens) if i > 0 and REFERENCE_TOKEN_RE.search(t)), None)
+    if cut is not None:
+        tokens = tokens[:cut]
+    elif len(tokens) > 1 and tokens[-1] in LOCATION_CODES:
+        tokens = tokens[:-1]
+    tokens = [t for t in tokens if not REFERENCE_TOKEN_RE.search(t)]
+
+    name = " ".join(tokens).strip(" -.#")
+    return name or raw
+
+
+def intern_merchants(conn, places):
+    """
+    Return {place: merchant_id} for the given places, adding any places and
+    merchants that are not in the merchants tables yet.
+    """
+    places = list({str(p) for p in places})
+    merchant_ids = {}
+
+    # Stay under SQLite's bound parameter limit
+    for start in range(0, len(places), 500):
+        chunk = places[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        merchant_ids.update(conn.execute(
+            f"SELECT place, merchant_id FROM merchant_places WHERE place IN ({placeholders})",
+            chunk
+        ).fetchall())
+
+    new_places = [p for p in places if p not in merchant_ids]
+    if not new_places:
+        return merchant_ids
+
+    names = {place: normalize_merchant(place) for place in new_places}
+    conn.executemany("INSERT OR IGNORE INTO merchants (name) VALUES (?)", [(n,) for n in set(names.values())])
+    id_by_name = {}
+    unique_names = list(set(names.values()))
+    for start in range(0, len(unique_names), 500):
+        chunk = unique_names[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        id_by_name.update(conn.execute(
+            f"SELECT name, id FROM merchants WHERE name IN ({placeholders})",
+            chunk
+        ).fetchall())
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO merchant_places (place, merchant_id) VALUES (?, ?)",
+        [(place, id_by_name[name]) for place, name in names.items()]
+    )
+    for place, name in names.items():
+        merchant_ids[place] = id_by_name[name]
+    return merchant_ids
@@ -1,13 +1,18 @@
 import streamlit as st
 
 from src.constants import *
-from src.database import update_transaction_category_db
+from src.database import update_transaction_category_db, search_transactions
 from src.backend import update_transaction_category_config
 
 
 def raw_data_viewer(df, category_config):
     st.title("📋 Raw Transaction Data")
 
+    query = st.text_input("Search descriptions (use \"quotes\" for phrases, e.g. amazon \"prime video\")")
+    if query.strip():
+        df = search_transactions(query, ledgers=st.session_state.get("selected_ledgers"))
+        st.caption(f"{len(df)} matching transactions")
+
     df = df.reset_index(drop=True)
     df["RowID"] = df.index
     st.dataframe(df, use_container_width=True)
@@ -28,7 +33,7 @@ def raw_data_viewer(df, category_config):
         )
 
         if st.button("Modify Category"):
-            success = update_transaction_category_db(selected_transaction, new_category) and update_transaction_category_config(new_category, selected_transaction[PLACE_STR], CATEGORY_CONFIG_PATH)
+            success = update_transaction_category_db(selected_transaction[ID_STR], new_category) and update_transaction_category_config(new_category, selected_transaction[PLACE_STR], CATEGORY_CONFIG_PATH)
             if success:
                 st.success("Category updated in DB and config.")
                 st.rerun()
\ No newline at end of file
@@ -0,0 +1,108 @@
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import yaml
+
+from src.database import get_data_generation, get_dataframe_from_database
+
+DEFAULT_MAX_ENTRIES = 128
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+
+def estimate_size(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    LRU cache for view computations, bounded by entry count and estimated memory.
+    Streamlit reruns the page script on every interaction, but this module is
+    imported once per server process, so entries survive across reruns and sessions.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = compute()
+        size = estimate_size(value)
+
+        with self._lock:
+            if size > self.max_bytes or key in self._entries:
+                return value
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+view_cache = ResultCache()
+
+
+def config_hash(*configs):
+    dumped = "\n---\n".join(yaml.safe_dump(c, sort_keys=True) for c in configs)
+    return hashlib.sha1(dumped.encode()).hexdigest()
+
+
+def cache_key(view, *parts, ledgers=None):
+    # Every cached result is tied to the data generation and the selected ledgers
+    ledgers = tuple(sorted(ledgers)) if ledgers else None
+    return (view, get_data_generation(), ledgers) + tuple(parts)
+
+
+def cached_dataframe(ledgers=None):
+    # Views modify the frame they get, so each caller gets its own copy
+    key = cache_key("transactions", ledgers=ledgers)
+    return view_cache.get_or_compute(key, lambda: get_dataframe_from_database(ledgers)).copy()
+
+
+def format_cache_stats(stats=None):
+    stats = stats or view_cache.stats()
+    return (
+        f"View cache: {stats['hit_rate']:.0%} hit rate ({stats['hits']} hits / {stats['misses']} misses), "
+        f"{stats['entries']} entries, {stats['bytes'] / 1024 ** 2:.1f} MB"
+    )
@@ -1,21 +1,29 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import yaml
 
 from src.constants import *
 from src.backend import parse_date_input
+from src.database import update_transactions_category_db
+from src.suggestions import build_suggestion_index, suggest_categories
+from src.result_cache import view_cache, cache_key, config_hash
 
 
-def conscious_spending_plan(df, config):
-    st.title("📅 Conscious Spending Plan")
-    user_input = st.text_input("Enter month, year or date range (e.g. 'Jan 2024', '2024', 'Jan 2024 to Mar 2024')")
+def exclude_transfers(df):
+    # Remove internal transfers
+    return df[~((df[ACCOUNT_STR].isin(["checking", "savings"])) &
+                df[PLACE_STR].str.contains("Internet Banking INTERNET TRANSFER", case=False, na=False))].copy()
 
-    try:
-        start_date, end_date, is_year_only = parse_date_input(user_input)
-    except Exception as e:
-        st.warning(str(e))
-        return
+def filter_income(df):
+    income_data = df[df[INCOME_STR] > 0]
+    income_data = income_data[
+        ~income_data[PLACE_STR].str.contains("THANK YOU", case=False, na=False) &
+        ~income_data[PLACE_STR].str.contains("Internet Banking INTERNET TRANSFER 000000114295", case=False, na=False)
+    ]
+    return income_data.drop_duplicates(subset=[DATE_STR, PLACE_STR, INCOME_STR])
 
+def compute_period_data(df, config, start_date, end_date, is_year_only):
     df[DATE_STR] = pd.to_datetime(df[DATE_STR])
 
     if is_year_only:
@@ -25,49 +33,177 @@ def conscious_spending_plan(df, config):
     else:
         filtered = df[(df[DATE_STR].dt.month == start_date.month) & (df[DATE_STR].dt.year == start_date.year)]
 
-    # Remove internal transfers
-    filtered = filtered[~((filtered[ACCOUNT_STR].isin(["checking", "savings"])) &
-                          filtered[PLACE_STR].str.contains("Internet Banking INTERNET TRANSFER", case=False, na=False))]
-
-    # Filter income data
-    income_data = filtered[filtered[INCOME_STR] > 0]
-    income_data = income_data[
-        ~income_data[PLACE_STR].str.contains("THANK YOU", case=False, na=False) &
-        ~income_data[PLACE_STR].str.contains("Internet Banking INTERNET TRANSFER 000000114295", case=False, na=False)
-    ]
-    income_data = income_data.drop_duplicates(subset=[DATE_STR, PLACE_STR, INCOME_STR])
+    filtered = exclude_transfers(filtered)
+    income_data = filter_income(filtered)
 
-    if income_data.empty:
-        st.warning("No income transactions found in the selected period.")
-        return
+    # --- Process expenses with visible bounds ---
+    filtered[EXPENSE_STR] = pd.to_numeric(filtered[EXPENSE_STR].fillna(0), errors="coerce")
+    expenses_by_category = filtered.groupby(CATEGORY_STR)[EXPENSE_STR].sum()
+    category_expenses = {
+        category: filtered[(filtered[CATEGORY_STR] == category) & (filtered[EXPENSE_STR] > 0)][[DATE_STR, PLACE_STR, EXPENSE_STR]]
+        for category in config["spending_categories"]
+    }
+    unknown_df = filtered[(filtered[CATEGORY_STR] == "uncategorized") & (filtered[EXPENSE_STR] > 0)]
 
-    # Income inclusion mode
-    option = st.radio(
-        "Choose which income to include:",
-        ["Include everything", "Employer only"]
-    )
+    return {
+        "income_data": income_data,
+        "expenses_by_category": expenses_by_category,
+        "category_expenses": category_expenses,
+        "unknown_df": unknown_df,
+    }
 
-    # Employer filtering
-    with open("configs/contacts.yaml", "r") as f:
+def load_employer_keywords():
+    with open(CONTACTS_PATH, "r") as f:
         contacts = yaml.safe_load(f)
     employer_keywords = [c.get("keyword", "").lower()
                          for c in contacts.get("contacts", [])
                          if c.get("name", "").lower() == "employer"]
     employer_keywords.append("payroll")
+    return employer_keywords
 
+def compute_included_income(income_data, employer_keywords, option):
     if option == "Include everything":
         included_income = income_data.copy()
     else:
         mask = income_data[PLACE_STR].str.lower().str.contains("|".join(employer_keywords), na=False)
         included_income = income_data[mask]
 
-    total_income = included_income[INCOME_STR].sum()
-    st.subheader(f"Total Included Income: ${total_income:.2f}")
-    st.dataframe(included_income[[DATE_STR, PLACE_STR, INCOME_STR]])
+    return included_income[[DATE_STR, PLACE_STR, INCOME_STR]], included_income[INCOME_STR].sum()
 
-    # --- Process expenses with visible bounds ---
-    filtered[EXPENSE_STR] = pd.to_numeric(filtered[EXPENSE_STR].fillna(0), errors="coerce")
-    expenses_by_category = filtered.groupby(CATEGORY_STR)[EXPENSE_STR].sum()
+BUDGET_FREQUENCIES = {"Monthly": "M", "Weekly": "W"}
+
+def compute_budget_compliance(df, config, freq="M", employer_keywords=None, option="Include everything"):
+    """
+    Percent of income spent in every category for every month (freq="M") or
+    week (freq="W") of the history, computed in one pivot instead of one pass
+    per period. Returns the category x period percent matrix, a matching boolean
+    matrix flagging cells outside the category's target_range, and the income per period.
+    Periods without income have no percentage and are never flagged.
+    """
+    categories = list(config["spending_categories"])
+    df[DATE_STR] = pd.to_datetime(df[DATE_STR], errors="coerce")
+    df = exclude_transfers(df[df[DATE_STR].notna()])
+    if df.empty:
+        empty = pd.DataFrame(index=pd.Index(categories, name=CATEGORY_STR))
+        return {"pct": empty, "flags": empty.astype(bool), "income": pd.Series(dtype=float)}
+
+    periods = df[DATE_STR].dt.to_period(freq)
+    all_periods = pd.period_range(periods.min(), periods.max(), freq=freq)
+
+    income_data, _ = compute_included_income(filter_income(df), employer_keywords or [], option)
+    income = (
+        income_data[INCOME_STR].groupby(income_data[DATE_STR].dt.to_period(freq)).sum()
+        .reindex(all_periods, fill_value=0)
+    )
+
+    expenses = pd.to_numeric(df[EXPENSE_STR].fillna(0), errors="coerce").fillna(0)
+    spent = pd.pivot_table(
+        pd.DataFrame({CATEGORY_STR: df[CATEGORY_STR], "period": periods, EXPENSE_STR: expenses}),
+        values=EXPENSE_STR, index=CATEGORY_STR, columns="period", aggfunc="sum", fill_value=0, observed=True
+    ).reindex(index=categories, columns=all_periods, fill_value=0)
+
+    pct = spent.div(income.where(income > 0), axis=1) * 100
+    bounds = np.array([settings.get("target_range", [0, 0]) for settings in config["spending_categories"].values()],
+                      dtype=float).reshape(-1, 2) * 100
+    values = pct.to_numpy()
+    with np.errstate(invalid="ignore"):
+        flags = (values < bounds[:, [0]]) | (values > bounds[:, [1]])
+
+    return {
+        "pct": pct,
+        "flags": pd.DataFrame(flags, index=pct.index, columns=pct.columns),
+        "income": income,
+    }
+
+def style_budget_compliance(pct, config):
+    # Heatmap without matplotlib: red above the target range, blue below and green
+    # within, shaded by how far out of range the category is
+    bounds = np.array([config["spending_categories"][c].get("target_range", [0, 0]) for c in pct.index],
+                      dtype=float).reshape(-1, 2) * 100
+    lower, upper = bounds[:, [0]], bounds[:, [1]]
+    values = pct.to_numpy()
+    with np.errstate(invalid="ignore"):
+        deviation = np.maximum((values - upper) / np.maximum(upper, 1), (lower - values) / np.maximum(lower, 1))
+        color = np.where(values > upper, "214, 39, 40", np.where(values < lower, "31, 119, 180", "44, 160, 44"))
+    alpha = (0.25 + 0.65 * np.clip(deviation, 0, 1)).round(2).astype(str)
+
+    color = pd.DataFrame(color, index=pct.index, columns=pct.columns)
+    alpha = pd.DataFrame(alpha, index=pct.index, columns=pct.columns)
+    css = "background-color: rgba(" + color + ", " + alpha + ")"
+    return css.mask(pct.isna(), "")
+
+def show_budget_compliance(load_df, config, ledgers=None):
+    frequency = st.radio("Period", list(BUDGET_FREQUENCIES), horizontal=True, key="compliance_frequency")
+    option = st.radio("Income", ["Include everything", "Employer only"], horizontal=True, key="compliance_income")
+    employer_keywords = load_employer_keywords()
+
+    freq = BUDGET_FREQUENCIES[frequency]
+    compliance = view_cache.get_or_compute(
+        cache_key("budget_compliance", freq, option, config_hash(config, employer_keywords), ledgers=ledgers),
+        lambda: compute_budget_compliance(load_df(), config, freq, employer_keywords, option)
+    )
+    pct, flags = compliance["pct"], compliance["flags"]
+    if pct.empty or pct.columns.empty:
+        st.info("No transactions to evaluate.")
+        return
+
+    evaluated = pct.notna().sum(axis=1)
+    st.dataframe(pd.DataFrame({
+        "periods out of range": flags.sum(axis=1),
+        "periods evaluated": evaluated,
+        "compliance": (1 - flags.sum(axis=1) / evaluated.where(evaluated > 0)).map(lambda v: f"{v:.0%}" if pd.notna(v) else "–"),
+    }))
+
+    display = pct.copy()
+    display.columns = display.columns.astype(str)
+    st.dataframe(
+        display.style.apply(lambda d: style_budget_compliance(d, config), axis=None).format("{:.1f}%", na_rep="–"),
+        use_container_width=True
+    )
+    st.caption("Percent of income per category. Red is above the target range, blue below, green within; "
+               "– marks periods without income.")
+
+def conscious_spending_plan(load_df, config, ledgers=None):
+    st.title("📅 Conscious Spending Plan")
+    with st.expander("📈 Budget compliance across all periods"):
+        show_budget_compliance(load_df, config, ledgers)
+
+    user_input = st.text_input("Enter month, year or date range (e.g. 'Jan 2024', '2024', 'Jan 2024 to Mar 2024')")
+
+    try:
+        start_date, end_date, is_year_only = parse_date_input(user_input)
+    except Exception as e:
+        st.warning(str(e))
+        return
+
+    period = (start_date, end_date, is_year_only)
+    settings_hash = config_hash(config)
+    period_data = view_cache.get_or_compute(
+        cache_key("spending_plan", period, settings_hash, ledgers=ledgers),
+        lambda: compute_period_data(load_df(), config, *period)
+    )
+    income_data = period_data["income_data"]
+    expenses_by_category = period_data["expenses_by_category"]
+
+    if income_data.empty:
+        st.warning("No income transactions found in the selected period.")
+        return
+
+    # Income inclusion mode
+    option = st.radio(
+        "Choose which income to include:",
+        ["Include everything", "Employer only"]
+    )
+
+    # Employer filtering
+    employer_keywords = load_employer_keywords()
+    included_income, total_income = view_cache.get_or_compute(
+        cache_key("spending_plan_income", period, option, config_hash(employer_keywords), ledgers=ledgers),
+        lambda: compute_included_income(income_data, employer_keywords, option)
+    )
+
+    st.subheader(f"Total Included Income: ${total_income:.2f}")
+    st.dataframe(included_income)
 
     for category, settings in config["spending_categories"].items():
         lower, upper = settings.get("target_range", [0, 0])
@@ -82,12 +218,12 @@ def conscious_spending_plan(df, config):
         else:
             st.error("❌ Outside target")
 
-        cat_df = filtered[(filtered[CATEGORY_STR] == category) & (filtered[EXPENSE_STR] > 0)]
+        cat_df = period_data["category_expenses"][category]
         if not cat_df.empty:
-            st.dataframe(cat_df[[DATE_STR, PLACE_STR, EXPENSE_STR]])
+            st.dataframe(cat_df)
 
     # --- Uncategorized handling ---
-    unknown_df = filtered[(filtered[CATEGORY_STR] == "uncategorized") & (filtered[EXPENSE_STR] > 0)]
+    unknown_df = period_data["unknown_df"]
     unc_total = unknown_df[EXPENSE_STR].sum()
     unc_pct = (unc_total / total_income) * 100 if total_income else 0
     st.markdown(f"### Uncategorized: ${unc_total:.2f} ({unc_pct:.2f}%)")
@@ -96,24 +232,39 @@ def conscious_spending_plan(df, config):
         st.dataframe(unknown_df[[DATE_STR, PLACE_STR, EXPENSE_STR]])
 
         st.markdown("### Categorize Uncategorized Transactions")
-        for idx, row in unknown_df.iterrows():
-            label = f"{row[DATE_STR].date()} - {row[PLACE_STR]} - ${row[EXPENSE_STR]:.2f}"
-            new_category = st.selectbox(
-                f"Assign category for: {label}",
-                ["-- skip --"] + list(config["spending_categories"].keys()),
-                key=f"uncat_{idx}"
-            )
-            if new_category != "-- skip --":
-                # Update the dataframe in memory
-                filtered.at[idx, CATEGORY_STR] = new_category
-
-                # Add the transaction's place as a keyword in config.yaml
-                place_keyword = str(row[PLACE_STR]).strip()
-                if place_keyword.lower() not in [k.lower() for k in config["spending_categories"][new_category]["keywords"]]:
-                    config["spending_categories"][new_category]["keywords"].append(place_keyword)
-
-        # Save updated config back to disk
-        if st.button("💾 Save categorization updates"):
+        spending_categories = list(config["spending_categories"].keys())
+        suggestions = view_cache.get_or_compute(
+            cache_key("spending_plan_suggestions", period, settings_hash, ledgers=ledgers),
+            lambda: suggest_categories(build_suggestion_index(load_df(), spending_categories), unknown_df)
+        ).copy()
+
+        min_confidence = st.slider("Pre-select suggestions with confidence of at least", 0.0, 1.0, 0.5, 0.05)
+        suggestions.insert(0, "accept", suggestions["confidence"] >= min_confidence)
+
+        edited = st.data_editor(
+            suggestions,
+            column_config={
+                "accept": st.column_config.CheckboxColumn("Accept"),
+                "suggested_category": st.column_config.SelectboxColumn("Category", options=spending_categories),
+                "keyword": st.column_config.TextColumn("Keyword"),
+                "confidence": st.column_config.ProgressColumn("Confidence", min_value=0.0, max_value=1.0),
+            },
+            disabled=[ID_STR, DATE_STR, PLACE_STR, EXPENSE_STR, "confidence"],
+            hide_index=True,
+            use_container_width=True,
+            key="uncategorized_suggestions"
+        )
+
+        # Save accepted suggestions: short keywords to config, categories to the database
+        if st.button("💾 Accept selected suggestions"):
+            accepted = edited[edited["accept"] & edited["suggested_category"].isin(spending_categories)]
+            for category, keyword in accepted[["suggested_category", "keyword"]].drop_duplicates().itertuples(index=False):
+                keyword = str(keyword).strip().lower()
+                keywords = config["spending_categories"][category].setdefault("keywords", [])
+                if keyword and keyword not in [k.lower() for k in keywords]:
+                    keywords.append(keyword)
+
             with open(CATEGORY_CONFIG_PATH, "w") as f:
                 yaml.safe_dump(config, f)
-            st.success("Config.yaml updated with new keywords!")
+            update_transactions_category_db(dict(zip(accepted[ID_STR], accepted["suggested_category"])))
+            st.success(f"Categorized {len(accepted)} transactions and updated config.yaml keywords!")
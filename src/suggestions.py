@@ -0,0 +1,294 @@
+import re
+import zlib
+import numpy as np
+import pandas as pd
+
+from src.constants import *
+from src.merchants import normalize_merchant
+
+NGRAM_SIZE = 3
+HASH_DIMENSIONS = 2 ** 12
+TOP_K = 5
+BATCH_SIZE = 1000
+# Bounds on the dense (batch x reference merchants) similarity block and on the
+# (query n-gram, reference merchant) pairs expanded to fill it
+MAX_SIMILARITY_CELLS = 4 * 1024 ** 2
+MAX_POSTING_PAIRS = 2 * 1024 ** 2
+MIN_KEYWORD_LENGTH = 4
+STOP_WORDS = {"the", "and", "inc", "ltd", "llc", "corp", "store", "shop", "online", "www", "com"}
+WORD_RE = re.compile(r"[a-z0-9&'-]+")
+
+
+def _ngram_ids(text):
+    padded = f" {text} "
+    return [zlib.crc32(padded[i:i + NGRAM_SIZE].encode()) % HASH_DIMENSIONS
+            for i in range(max(1, len(padded) - NGRAM_SIZE + 1))]
+
+
+def _sparse_counts(texts):
+    # Sparse (row, n-gram, count) triplets; merchant names only have a few dozen n-grams each
+    rows, cols = [], []
+    for i, text in enumerate(texts):
+        ids = _ngram_ids(text)
+        rows.extend([i] * len(ids))
+        cols.extend(ids)
+
+    keys, counts = np.unique(
+        np.array(rows, dtype=np.int64) * HASH_DIMENSIONS + np.array(cols, dtype=np.int64), return_counts=True
+    )
+    return keys // HASH_DIMENSIONS, keys % HASH_DIMENSIONS, counts
+
+
+def _tfidf(rows, cols, counts, idf, n_rows):
+    weights = np.log1p(counts).astype(np.float32) * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n_rows)).astype(np.float32)
+    norms[norms == 0] = 1
+    return weights / norms[rows]
+
+
+def _similarity(index, rows, cols, weights, n_rows):
+    """
+    Cosine similarity of n_rows query vectors against every reference merchant,
+    as a sparse-sparse product over the n-gram postings of the index.
+    """
+    starts = index["gram_ptr"][cols]
+    lengths = index["gram_ptr"][cols + 1] - starts
+    entry = np.repeat(np.arange(len(cols)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    postings = starts[entry] + offsets
+
+    n_reference = len(index["names"])
+    cells = rows[entry] * n_reference + index["posting_rows"][postings]
+    values = weights[entry] * index["posting_weights"][postings]
+    return np.bincount(cells, weights=values, minlength=n_rows * n_reference).reshape(n_rows, n_reference)
+
+
+def _batches(pairs_per_row, max_rows):
+    # Consecutive row ranges of at most max_rows rows and about MAX_POSTING_PAIRS pairs
+    cumulative = np.cumsum(pairs_per_row)
+    start = 0
+    while start < len(pairs_per_row):
+        done = cumulative[start - 1] if start else 0
+        end = int(np.searchsorted(cumulative, done + MAX_POSTING_PAIRS, side="right"))
+        end = min(max(end, start + 1), start + max_rows, len(pairs_per_row))
+        yield start, end
+        start = end
+
+
+def _byte_trigrams(texts):
+    """
+    Exact byte trigram postings of texts: sorted unique trigram keys, a pointer
+    array into text ids grouped by trigram. Byte substrings of UTF-8 text are
+    string substrings, so a text containing a candidate has all its trigrams.
+    """
+    encoded = [t.encode() for t in texts]
+    lengths = np.array([len(e) for e in encoded], dtype=np.int64)
+    # Texts are separated by NUL bytes, which invalidate windows spanning two texts
+    buffer = np.frombuffer(b"\0".join(encoded) + b"\0", dtype=np.uint8).astype(np.int64)
+    owners = np.repeat(np.arange(len(texts), dtype=np.int64), lengths + 1)
+
+    grams = (buffer[:-2] << 16) | (buffer[1:-1] << 8) | buffer[2:]
+    valid = (buffer[:-2] != 0) & (buffer[1:-1] != 0) & (buffer[2:] != 0)
+    pairs = np.unique(grams[valid] * len(texts) + owners[:-2][valid])
+
+    text_grams = pairs // len(texts)
+    gram_keys, gram_starts = np.unique(text_grams, return_index=True)
+    return gram_keys, np.append(gram_starts, len(pairs)), pairs % len(texts)
+
+
+def _conflicts(index, candidate, category_code):
+    # Whether a merchant name or place of another category contains candidate;
+    # trigram postings narrow the texts that need the actual substring test
+    texts = index["keyword_texts"]
+    data = np.frombuffer(candidate.encode(), dtype=np.uint8).astype(np.int64)
+    if len(data) < 3:
+        matches = np.arange(len(texts))
+    else:
+        grams = np.unique((data[:-2] << 16) | (data[1:-1] << 8) | data[2:])
+        slots = np.searchsorted(index["keyword_gram_keys"], grams)
+        if (slots >= len(index["keyword_gram_keys"])).any() or (index["keyword_gram_keys"][slots] != grams).any():
+            return False
+        ptr, postings = index["keyword_gram_ptr"], index["keyword_postings"]
+        lists = sorted((postings[ptr[i]:ptr[i + 1]] for i in slots), key=len)
+        matches = lists[0]
+        for posting in lists[1:]:
+            # Postings are sorted text ids, so intersect by binary search
+            slots = np.minimum(np.searchsorted(posting, matches), len(posting) - 1)
+            matches = matches[posting[slots] == matches]
+            if not len(matches):
+                return False
+    matches = matches[index["keyword_codes"][matches] != category_code]
+    return any(candidate in texts[i] for i in matches)
+
+
+def _merchant_names(df):
+    if MERCHANT_STR in df.columns:
+        names = df[MERCHANT_STR].where(df[MERCHANT_STR].notna(), df[PLACE_STR].map(normalize_merchant))
+    else:
+        names = df[PLACE_STR].map(normalize_merchant)
+    return names.astype(str)
+
+
+def _keyword_candidates(merchant):
+    words = [w for w in WORD_RE.findall(merchant) if len(w) >= MIN_KEYWORD_LENGTH and w not in STOP_WORDS]
+    pairs = [" ".join(p) for p in zip(merchant.split(), merchant.split()[1:])]
+    return words, pairs
+
+
+def build_suggestion_index(categorized_df, categories):
+    """
+    Build a character n-gram TF-IDF index over the merchants of already
+    categorized transactions, one entry per merchant with its most common category.
+    """
+    df = categorized_df[categorized_df[CATEGORY_STR].isin(categories)]
+    if df.empty:
+        return None
+
+    merchants = pd.DataFrame({MERCHANT_STR: _merchant_names(df), CATEGORY_STR: df[CATEGORY_STR]})
+    reference = (
+        merchants.groupby([MERCHANT_STR, CATEGORY_STR]).size()
+        .sort_values(ascending=False)
+        .reset_index()
+        .drop_duplicates(subset=MERCHANT_STR)
+        .reset_index(drop=True)
+    )
+    names = reference[MERCHANT_STR].to_numpy()
+    category_names, category_codes = np.unique(reference[CATEGORY_STR].to_numpy(), return_inverse=True)
+
+    rows, cols, counts = _sparse_counts(names)
+    document_frequency = np.bincount(cols, minlength=HASH_DIMENSIONS)
+    idf = (np.log((1 + len(reference)) / (1 + document_frequency)) + 1).astype(np.float32)
+    weights = _tfidf(rows, cols, counts, idf, len(reference))
+
+    # Postings by n-gram (the transposed sparse matrix) for the similarity product
+    order = np.argsort(cols, kind="stable")
+    gram_ptr = np.concatenate([[0], np.cumsum(document_frequency)])
+
+    # Keywords are matched as substrings of places, so the keyword check looks
+    # for candidates inside every categorized merchant name and raw place
+    keyword_reference = pd.concat([
+        pd.DataFrame({"text": names, CATEGORY_STR: reference[CATEGORY_STR].to_numpy()}),
+        pd.DataFrame({"text": df[PLACE_STR].astype(str).str.lower().to_numpy(), CATEGORY_STR: df[CATEGORY_STR].to_numpy()}),
+    ]).drop_duplicates(ignore_index=True)
+    keyword_texts = keyword_reference["text"].tolist()
+    keyword_gram_keys, keyword_gram_ptr, keyword_postings = _byte_trigrams(keyword_texts)
+
+    return {
+        "names": names,
+        "category_names": category_names,
+        "category_codes": category_codes,
+        "idf": idf,
+        "gram_ptr": gram_ptr,
+        "posting_rows": rows[order],
+        "posting_weights": weights[order],
+        "keyword_texts": keyword_texts,
+        "keyword_codes": np.searchsorted(category_names, keyword_reference[CATEGORY_STR].to_numpy()),
+        "keyword_gram_keys": keyword_gram_keys,
+        "keyword_gram_ptr": keyword_gram_ptr,
+        "keyword_postings": keyword_postings,
+    }
+
+
+def generalize_keyword(place, merchant, category_code, neighbour_names, index):
+    """
+    Pick the shortest word or word pair of the merchant name that still matches
+    the raw place, and that no merchant name or place of another category
+    contains, since keywords are matched as substrings.
+    Words shared with same-category neighbours are tried first.
+    """
+    place_lower = str(place).lower()
+    words, pairs = _keyword_candidates(merchant)
+
+    shared = [w for w in words if any(w in n for n in neighbour_names)]
+    candidates = sorted(shared, key=len) + sorted(words, key=len) + sorted(pairs, key=len) + [merchant]
+
+    for candidate in candidates:
+        if candidate not in place_lower:
+            continue
+        if not _conflicts(index, candidate, category_code):
+            return candidate
+
+    return place_lower.strip()
+
+
+def suggest_categories(index, uncategorized_df):
+    """
+    Suggest a category and a short keyword for every row of uncategorized_df.
+    The confidence combines the similarity of the best matching merchant with
+    how strongly its top neighbours agree on the category.
+    """
+    columns = [ID_STR, DATE_STR, PLACE_STR, EXPENSE_STR, "suggested_category", "keyword", "confidence"]
+    if uncategorized_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    df = uncategorized_df.copy()
+    df[MERCHANT_STR] = _merchant_names(df)
+    if ID_STR not in df.columns:
+        df[ID_STR] = None
+
+    if index is None:
+        # Nothing categorized yet to learn from; rows are left for manual selection
+        df["suggested_category"] = None
+        df["keyword"] = df[MERCHANT_STR]
+        df["confidence"] = 0.0
+        return df[columns]
+    merchants = df[MERCHANT_STR].drop_duplicates().to_numpy()
+
+    n_reference = len(index["names"])
+    n_categories = len(index["category_names"])
+    k = min(TOP_K, n_reference)
+    batch_size = max(1, min(BATCH_SIZE, MAX_SIMILARITY_CELLS // n_reference))
+
+    rows, cols, counts = _sparse_counts(merchants)
+    weights = _tfidf(rows, cols, counts, index["idf"], len(merchants))
+    row_ptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(merchants)))])
+    posting_lengths = index["gram_ptr"][cols + 1] - index["gram_ptr"][cols]
+    pairs_per_row = np.bincount(rows, weights=posting_lengths, minlength=len(merchants))
+
+    category_codes = np.empty(len(merchants), dtype=np.intp)
+    confidences = np.empty(len(merchants))
+    neighbours_by_merchant = {}
+    for start, end in _batches(pairs_per_row, batch_size):
+        batch = merchants[start:end]
+        entries = slice(row_ptr[start], row_ptr[end])
+        similarity = _similarity(index, rows[entries] - start, cols[entries], weights[entries], len(batch))
+
+        top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        top_similarity = np.take_along_axis(similarity, top, axis=1)
+        top_codes = index["category_codes"][top]
+
+        # Similarity-weighted votes of the top neighbours, for the whole batch at once
+        batch_rows = np.repeat(np.arange(len(batch)), k)
+        votes = np.zeros((len(batch), n_categories))
+        np.add.at(votes, (batch_rows, top_codes.ravel()), top_similarity.ravel())
+        voted = np.zeros((len(batch), n_categories), dtype=bool)
+        voted[batch_rows, top_codes.ravel()] = True
+        votes[~voted] = -np.inf
+
+        best = votes.argmax(axis=1)
+        best_votes = votes[np.arange(len(batch)), best]
+        total = np.where(voted, np.clip(votes, 0, None), 0).sum(axis=1)
+        share = np.divide(best_votes, total, out=np.zeros(len(batch)), where=total > 0)
+        agrees = top_codes == best[:, None]
+        best_similarity = np.where(agrees, top_similarity, -np.inf).max(axis=1)
+
+        category_codes[start:end] = best
+        confidences[start:end] = np.clip(best_similarity, 0, None) * share
+        for merchant, neighbours, agree in zip(batch, top, agrees):
+            neighbours_by_merchant[merchant] = index["names"][neighbours[agree]].tolist()
+
+    code_by_merchant = dict(zip(merchants, category_codes))
+    keywords = {}
+    for place, merchant in df[[PLACE_STR, MERCHANT_STR]].drop_duplicates().itertuples(index=False):
+        keywords[place] = generalize_keyword(
+            place, merchant, code_by_merchant[merchant], neighbours_by_merchant[merchant], index
+        )
+
+    by_merchant = pd.DataFrame(
+        {"suggested_category": index["category_names"][category_codes], "confidence": confidences.round(3)},
+        index=merchants
+    )
+    df = df.join(by_merchant, on=MERCHANT_STR)
+    df["keyword"] = df[PLACE_STR].map(keywords)
+
+    return df[columns].sort_values("confidence", ascending=False)